@@ -0,0 +1,338 @@
+# import modules
+import ee
+import os
+import json
+import tempfile
+import multiprocessing
+import subprocess
+import sys
+import time
+import statistics
+import tracemalloc
+import geeutil.feature_utils as feature_utils
+import geeutil.h3_utils as h3_utils
+import geeutil.normalised_difference as nd
+import geeutil.raster_utils as raster_utils
+import geeutil.sentinel2_utils as s2_utils
+
+
+# define global variables
+# geeutil modules measured by import_times
+geeutil_modules = ['geeutil.ee_utils', 'geeutil.http_utils', 'geeutil.task_utils', 'geeutil.cache_utils',
+                   'geeutil.composite_utils', 'geeutil.export_utils', 'geeutil.feature_utils', 'geeutil.h3_utils',
+                   'geeutil.image_utils', 'geeutil.imagecollection_utils', 'geeutil.landsat_utils',
+                   'geeutil.local_utils', 'geeutil.normalised_difference', 'geeutil.rate_utils', 'geeutil.raster_utils',
+                   'geeutil.sentinel2_utils', 'geeutil.timeseries_utils', 'geeutil.xarray_utils', 'geeutil.zonal_utils']
+
+
+def import_time(module, repeat=5):
+    """
+    function to measure time to import module in a fresh python process,
+    each import runs in a new process so nothing is cached by the interpreter
+
+    Args
+    module - str, module name eg. 'geeutil.image_utils'
+    repeat - number of processes started default=5
+
+    Returns
+    float, median import time in seconds
+    """
+    code = ('import time; t = time.perf_counter(); import {}; '
+            'print(time.perf_counter() - t)').format(module)
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip()))
+    return statistics.median(times)
+
+def import_times(modules=None, repeat=5):
+    """
+    function to measure import time of geeutil modules, none of the modules should initialize earth engine
+    or import gdal or geopandas at import time
+
+    Args
+    modules - list of module names default=None and geeutil_modules are used
+    repeat - number of processes started per module default=5
+
+    Returns
+    dict, module name and median import time in seconds
+    """
+    return {m: import_time(m, repeat) for m in (modules or geeutil_modules)}
+
+def slowest_imports(module, n=10):
+    """
+    function to return the slowest imports triggered by importing module using python -X importtime
+
+    Args
+    module - str, module name
+    n - number of imports returned default=10
+
+    Returns
+    list of tuples, imported module name and cumulative import time in seconds
+    """
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                         capture_output=True, text=True, check=True)
+    times = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(times, key=lambda t: t[1], reverse=True)[:n]
+
+def graph_size(ee_object):
+    """
+    function to return size of serialized earth engine expression
+
+    Args
+    ee_object - ee.ComputedObject eg. ee.Image or ee.ImageCollection
+
+    Returns
+    int, number of bytes in serialized expression
+    """
+    return len(ee_object.serialize().encode('utf-8'))
+
+class RequestCounter:
+    """
+    context manager that counts requests sent to the earth engine api while it is active
+    """
+
+    def __enter__(self):
+        self.count = 0
+        self._call = ee.data._execute_cloud_call
+
+        def counted_call(*args, **kwargs):
+            self.count += 1
+            return self._call(*args, **kwargs)
+
+        ee.data._execute_cloud_call = counted_call
+        return self
+
+    def __exit__(self, *exc):
+        ee.data._execute_cloud_call = self._call
+        return False
+
+def compare_graphs(builders, evaluate=None):
+    """
+    function to compare serialized expression size and number of requests of alternative ways of building
+    the same earth engine object
+
+    Args
+    builders - dict, name and function that returns ee.ComputedObject
+    evaluate - function called with each built object to evaluate it eg. lambda c: c.size().getInfo(),
+        default=None and objects are only built
+
+    Returns
+    dict, name and dict with graph_bytes, build_requests, build_time, eval_requests and eval_time
+    """
+    results = {}
+    for name, builder in builders.items():
+        with RequestCounter() as build_counter:
+            t0 = time.perf_counter()
+            ee_object = builder()
+            build_time = time.perf_counter() - t0
+        result = {'graph_bytes': graph_size(ee_object), 'build_requests': build_counter.count,
+                  'build_time': build_time}
+        if evaluate is not None:
+            with RequestCounter() as eval_counter:
+                t0 = time.perf_counter()
+                evaluate(ee_object)
+                result['eval_time'] = time.perf_counter() - t0
+            result['eval_requests'] = eval_counter.count
+        results[name] = result
+    return results
+
+def benchmark_s2_cloud_mask(collection, bands, band_names, evaluate=None):
+    """
+    function to compare the chain of cloud band, mask and rename maps previously used by gen_imageCollection
+    with the fused cloud_shadow_mask_pipeline
+
+    Args
+    collection - Sentinel-2 ee.ImageCollection joined with cloud probability by join_S2_cld_prob
+    bands - list of bands selected after masking
+    band_names - list of new band names
+    evaluate - function called with each masked collection default=None and collections are only built
+
+    Returns
+    dict, results returned by compare_graphs for chained and fused collections
+    """
+    def chained():
+        return (collection
+                .map(s2_utils.add_cloud_shadow_mask)
+                .map(s2_utils.mask_clouds)
+                .map(lambda img: img.select(bands).rename(band_names)))
+
+    def fused():
+        return collection.map(s2_utils.cloud_shadow_mask_pipeline(
+            output_bands=[], apply_mask=True, bands=bands, band_names=band_names))
+
+    return compare_graphs({'chained': chained, 'fused': fused}, evaluate)
+
+def benchmark_h3_index(gdf, cells, resolution=None, repeat=3):
+    """
+    function to compare descendant lookups with h3_utils.get_child_cells queries and a prebuilt h3_utils.H3Index
+
+    Args
+    gdf - h3 geodataframe
+    cells - list of h3 cell indexes descendants are found for
+    resolution - resolution of descendants returned default=None and descendants at all resolutions are returned
+    repeat - number of times each lookup is repeated default=3
+
+    Returns
+    dict, with index build time and median lookup times in seconds for query and index lookups
+    """
+    t0 = time.perf_counter()
+    index = h3_utils.H3Index(gdf)
+    build_time = time.perf_counter() - t0
+
+    query_times, index_times = [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for cell in cells:
+            h3_utils.get_child_cells(gdf, cell, resolution)
+        query_times.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        index.descendants(cells, resolution)
+        index_times.append(time.perf_counter() - t0)
+
+    return {'cells': len(cells), 'index_build_time': build_time, 'query_time': statistics.median(query_times),
+            'index_time': statistics.median(index_times)}
+
+def _json_gdf_to_featureCollection(gdf):
+    # previous gdf_to_featureCollection, geodataframe is serialized to geojson and parsed back
+    json_dict = json.loads(gdf.to_crs(4326).to_json())
+    features = []
+    for feature in json_dict['features']:
+        if feature['geometry']['type'] == 'LineString':
+            line = ee.Feature(ee.Geometry.LineString(feature['geometry']['coordinates']))
+            features.append(line.buffer(1500))
+        if feature['geometry']['type'] == 'Polygon':
+            features.append(ee.Feature(ee.Geometry.Polygon(feature['geometry']['coordinates'])))
+    return ee.FeatureCollection(features)
+
+def benchmark_gdf_conversion(gdf, **kwargs):
+    """
+    function to compare conversion time and serialized size of geojson round trip conversion with
+    feature_utils.gdf_to_featureCollection
+
+    Args
+    gdf - geopandas dataframe of LineString or Polygon features
+    kwargs - keyword arguments passed to gdf_to_featureCollection eg. columns, tolerance, precision
+
+    Returns
+    dict, with conversion time in seconds and serialized bytes of json and direct conversions
+    """
+    results = {}
+    for name, convert in (('json', _json_gdf_to_featureCollection),
+                          ('direct', lambda g: feature_utils.gdf_to_featureCollection(g, **kwargs))):
+        t0 = time.perf_counter()
+        collection = convert(gdf)
+        results[name] = {'time': time.perf_counter() - t0, 'graph_bytes': graph_size(collection)}
+    return results
+
+def benchmark_indices(collection, names, evaluate=None):
+    """
+    function to compare mapping one apply_* function per index with normalised_difference.add_indices
+
+    Args
+    collection - ee.ImageCollection with harmonized band names
+    names - list of index names in normalised_difference.indices
+    evaluate - function called with each collection default=None and collections are only built
+
+    Returns
+    dict, results returned by compare_graphs for chained and fused collections
+    """
+    def chained():
+        mapped = collection
+        for name in names:
+            mapped = mapped.map(nd.add_indices([name]))
+        return mapped
+
+    def fused():
+        return collection.map(nd.add_indices(names))
+
+    return compare_graphs({'chained': chained, 'fused': fused}, evaluate)
+
+def _write_test_raster(path, size, band_names):
+    # write uncompressed uint16 raster with random values and tiled layout
+    import numpy as np
+    from osgeo import gdal, osr
+
+    ds = gdal.GetDriverByName('GTiff').Create(path, size, size, len(band_names), gdal.GDT_UInt16,
+                                              ['TILED=YES', 'BLOCKXSIZE=256', 'BLOCKYSIZE=256', 'BIGTIFF=IF_SAFER'])
+    ds.SetGeoTransform([0, 10, 0, 0, 0, -10])
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(2193)
+    ds.SetProjection(srs.ExportToWkt())
+    rng = np.random.default_rng(0)
+    for i, name in enumerate(band_names):
+        band = ds.GetRasterBand(i + 1)
+        band.SetDescription(name)
+        for y in range(0, size, 1024):
+            rows = min(1024, size - y)
+            band.WriteArray(rng.integers(0, 10000, (rows, size), dtype=np.uint16), 0, y)
+    ds = None
+
+def _peak_rss(children=False):
+    # peak resident memory in bytes of this process or of its largest waited for child process,
+    # None where resource is unavailable eg. windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on linux and bytes on macos
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def _measure_pipeline(src_path, dst_path, operations, processes, queue):
+    # run pipeline in separate process so peak memory is measured per run
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    raster_utils.process_raster(src_path, dst_path, operations, processes=processes)
+    elapsed = time.perf_counter() - t0
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # pool workers are joined when process_raster returns so they are counted as children
+    queue.put((elapsed, _peak_rss(), _peak_rss(children=True) if processes > 1 else None, traced_peak))
+
+def benchmark_raster_pipeline(sizes=(1024, 4096, 8192), processes=None, operations=None, folder=None):
+    """
+    function to measure raster_utils.process_raster throughput and peak memory for synthetic rasters of several sizes
+
+    Args
+    sizes - list of raster sides in pixels default=(1024, 4096, 8192)
+    processes - number of worker processes default=None and all cpus are used
+    operations - list of pipeline operations default=None and ndvi and ndwi are added to 6 harmonized bands
+    folder - folder test rasters are written to default=None and a temporary folder is used
+
+    Returns
+    list of dicts, with size, input MB, seconds, MB/s per core, peak RSS in MB of the main process and of the largest
+        worker process, None where unavailable or without workers, and peak MB allocated by the main process while the
+        pipeline ran, measured with tracemalloc
+    """
+    band_names = ['blue', 'green', 'red', 'NIR', 'SWIR1', 'SWIR2']
+    operations = operations or [raster_utils.indices_op(['ndvi', 'ndwi'])]
+    processes = processes or os.cpu_count()
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=folder) as tmp:
+        for size in sizes:
+            src_path = os.path.join(tmp, 'src_{}.tif'.format(size))
+            dst_path = os.path.join(tmp, 'dst_{}.tif'.format(size))
+            _write_test_raster(src_path, size, band_names)
+
+            ctx = multiprocessing.get_context('spawn')
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_measure_pipeline, args=(src_path, dst_path, operations, processes, queue))
+            proc.start()
+            elapsed, rss_main, rss_worker, traced_peak = queue.get()
+            proc.join()
+
+            mb = size * size * len(band_names) * 2 / 1e6
+            results.append({'size': size, 'input_mb': mb, 'seconds': elapsed,
+                            'mb_per_s_per_core': mb / elapsed / processes,
+                            'peak_rss_main_mb': rss_main / 1024 ** 2 if rss_main is not None else None,
+                            'peak_rss_worker_mb': rss_worker / 1024 ** 2 if rss_worker is not None else None,
+                            'peak_traced_mb': traced_peak / 1024 ** 2})
+    return results
@@ -0,0 +1,190 @@
+# import modules
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import datetime
+import contextlib
+
+
+# define global variables
+# default location of on-disk cache
+default_cache_path = os.path.join(os.path.expanduser('~'), '.cache', 'geeutil', 'metadata.sqlite')
+
+
+def roi_hash(roi):
+    """
+    function to return hash of region of interest, earth engine objects are hashed from their serialized
+    expression so no request is made
+
+    Args
+    roi - ee.Geometry, ee.Feature, ee.FeatureCollection or GeoJSON dict
+
+    Returns
+    str, sha1 hash of roi
+    """
+    if hasattr(roi, 'serialize'):
+        text = roi.serialize()
+    else:
+        text = json.dumps(roi, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def make_key(collection_id, start_date, end_date, roi, filters=None):
+    """
+    function to return cache key for collection metadata
+
+    Args
+    collection_id - earth engine collection id
+    start_date - start date of collection as 'YYYY-MM-DD'
+    end_date - end date of collection as 'YYYY-MM-DD'
+    roi - region of interest used to filter collection
+    filters - dict of other filters applied to collection default=None
+
+    Returns
+    str, cache key
+    """
+    text = json.dumps([collection_id, start_date, end_date, roi_hash(roi), filters or {}], sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class MetadataCache:
+    """
+    class for persistent on-disk cache of collection metadata stored in sqlite.
+    Entries for date ranges that end before today are kept until evicted, entries that include today expire after ttl.
+    Least recently used entries are evicted when the cache is larger than max_bytes
+
+    Args
+    path - path to sqlite file default=default_cache_path
+    ttl - seconds entries for open date ranges are reused for default=86400
+    max_bytes - maximum size of cached values in bytes default=256MB
+    """
+
+    def __init__(self, path=default_cache_path, ttl=86400, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as con:
+            con.execute('CREATE TABLE IF NOT EXISTS entries ('
+                        'key TEXT PRIMARY KEY, collection_id TEXT, start_date TEXT, end_date TEXT, roi_hash TEXT, '
+                        'filters TEXT, value TEXT, size INTEGER, created REAL, accessed REAL, expires REAL)')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def expires(self, end_date, now=None):
+        """
+        function to return expiry time for entry, closed date ranges never expire
+
+        Args
+        end_date - end date of collection as 'YYYY-MM-DD', end date is exclusive
+        now - current time in seconds default=None and time.time() is used
+
+        Returns
+        float, expiry time in seconds or None
+        """
+        now = time.time() if now is None else now
+        today = datetime.date.fromtimestamp(now).isoformat()
+        return None if end_date <= today else now + self.ttl
+
+    def get(self, key):
+        """
+        function to return cached value, no network access is made
+
+        Args
+        key - cache key returned by make_key
+
+        Returns
+        cached value or None if key is not cached or has expired
+        """
+        now = time.time()
+        with self._connect() as con:
+            row = con.execute('SELECT value, expires FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] < now:
+                con.execute('DELETE FROM entries WHERE key = ?', (key,))
+                return None
+            con.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, collection_id=None, start_date=None, end_date=None, roi=None, filters=None):
+        """
+        function to add value to cache and evict least recently used entries if cache is larger than max_bytes
+
+        Args
+        key - cache key returned by make_key
+        value - json serializable value
+        collection_id, start_date, end_date, roi, filters - values used to build key, stored so entries can be queried
+        """
+        now = time.time()
+        text = json.dumps(value)
+        expires = self.expires(end_date, now) if end_date is not None else now + self.ttl
+        with self._connect() as con:
+            con.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (key, collection_id, start_date, end_date, roi_hash(roi) if roi is not None else None,
+                         json.dumps(filters or {}, sort_keys=True), text, len(text), now, now, expires))
+        self.evict()
+
+    def evict(self):
+        """
+        function to delete expired entries and least recently used entries until cache is smaller than max_bytes
+        """
+        with self._connect() as con:
+            con.execute('DELETE FROM entries WHERE expires IS NOT NULL AND expires < ?', (time.time(),))
+            total = con.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, size in con.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall():
+                con.execute('DELETE FROM entries WHERE key = ?', (key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def query(self, collection_id=None, start_date=None, end_date=None, roi=None):
+        """
+        function to list cached entries matching collection, date range and roi without network access
+
+        Args
+        collection_id - earth engine collection id default=None and all collections are returned
+        start_date - only return entries starting on or after start_date default=None
+        end_date - only return entries ending on or before end_date default=None
+        roi - only return entries for roi default=None
+
+        Returns
+        list of dicts, with collection_id, start_date, end_date, filters and value of each entry
+        """
+        clauses, params = ['(expires IS NULL OR expires >= ?)'], [time.time()]
+        if collection_id is not None:
+            clauses.append('collection_id = ?')
+            params.append(collection_id)
+        if start_date is not None:
+            clauses.append('start_date >= ?')
+            params.append(start_date)
+        if end_date is not None:
+            clauses.append('end_date <= ?')
+            params.append(end_date)
+        if roi is not None:
+            clauses.append('roi_hash = ?')
+            params.append(roi_hash(roi))
+        sql = ('SELECT collection_id, start_date, end_date, filters, value FROM entries WHERE '
+               + ' AND '.join(clauses) + ' ORDER BY start_date')
+        with self._connect() as con:
+            rows = con.execute(sql, params).fetchall()
+        return [{'collection_id': r[0], 'start_date': r[1], 'end_date': r[2], 'filters': json.loads(r[3]),
+                 'value': json.loads(r[4])} for r in rows]
+
+    def clear(self):
+        """
+        function to delete all cached entries
+        """
+        with self._connect() as con:
+            con.execute('DELETE FROM entries')
@@ -0,0 +1,170 @@
+# import modules
+import ee
+import geeutil.ee_utils as ee_utils
+import geeutil.image_utils as image_utils
+import geeutil.imagecollection_utils as ic_utils
+import geeutil.normalised_difference as nd
+
+
+# define global variables
+# compositing methods available to composite
+composite_methods = {'median', 'percentile', 'medoid', 'greenest', 'max_clear', 'reduce'}
+# default tileScale hint of composites, passed to exports of large regions
+default_tile_scale = 4
+
+
+def medoid_mosaic(collection, bands):
+    """
+    function to return medoid composite, each pixel is taken from the observation closest to the median of all bands
+
+    Args
+    collection - ee.ImageCollection object
+    bands - list of bands distance to median is measured over
+
+    Returns
+    ee.Image object
+    """
+    median = collection.select(bands).median()
+
+    def distance(image):
+        # negative distance so qualityMosaic keeps observation closest to median
+        dist = image.select(bands).subtract(median).pow(2).reduce(ee.Reducer.sum()).multiply(-1)
+        return image.addBands(dist.rename('medoid_distance'))
+
+    return collection.map(distance).qualityMosaic('medoid_distance').select(bands)
+
+def greenest_mosaic(collection, bands, index='ndvi'):
+    """
+    function to return greenest pixel composite, each pixel is taken from the observation with highest index value
+
+    Args
+    collection - ee.ImageCollection object with harmonized band names
+    bands - list of bands returned
+    index - index in normalised_difference.indices used as greenness default='ndvi'
+
+    Returns
+    ee.Image object with bands and index band
+    """
+    return collection.map(nd.add_indices([index])).qualityMosaic(index).select(ee.List(bands).add(index))
+
+def max_clear_mosaic(collection, bands, region, scale=30, quality_property=None):
+    """
+    function to return max clear observation composite, each pixel is taken from the observation of the scene with the
+    largest fraction of region covered by clear pixels
+
+    Args
+    collection - cloud masked ee.ImageCollection object
+    bands - list of bands returned
+    region - ee.Geometry object scenes are scored over
+    scale - resolution clear pixels are counted at default=30
+    quality_property - image property used as scene score eg. 'clear_fraction' set by rank_scenes. Default=None and
+        scenes are scored with imagecollection_utils.clear_fraction
+
+    Returns
+    ee.Image object
+    """
+    if quality_property is None:
+        collection = collection.map(ic_utils.clear_fraction(region, scale))
+        quality_property = 'clear_fraction'
+
+    def quality(image):
+        score = ee.Image.constant(image.get(quality_property)).toFloat().rename('clear_score')
+        return image.addBands(score.updateMask(image.select(0).mask()))
+
+    return collection.map(quality).qualityMosaic('clear_score').select(bands)
+
+@ee_utils.requires_ee
+def composite(collection, method='median', bands=None, percentiles=(10, 50, 90), reducers=None, region=None,
+              crs=None, scale=None, tile_scale=default_tile_scale, index='ndvi', quality_property=None):
+    """
+    function to reduce cloud masked ee.ImageCollection eg. returned by gen_imageCollection or gen_harmonized_collection
+    to composite image with a band counting valid observations per pixel
+
+    Args
+    collection - cloud masked ee.ImageCollection object
+    method - compositing method, one of composite_methods. Default='median'
+        median - per band median
+        percentile - per band percentiles, bands are named band_p10...
+        medoid - observation closest to median of all bands
+        greenest - observation with highest index value, index band is added
+        max_clear - observation of scene with most clear pixels in region
+        reduce - per band reduction with reducers
+    bands - list of bands composited default=None and all bands of first image are used
+    percentiles - list of percentiles for percentile method default=(10, 50, 90)
+    reducers - ee.Reducer, reducer name or list of names and ee.Reducer objects for reduce method default=None
+    region - region max_clear scenes are scored over and composite is clipped to. Default=None
+    crs - working crs of composite default=None and projection of first image is used
+    scale - working scale of composite default=None
+    tile_scale - tileScale hint saved as tile_scale property default=default_tile_scale
+    index - greenness index for greenest method default='ndvi'
+    quality_property - scene score property for max_clear method default=None, see max_clear_mosaic
+
+    Returns
+    ee.Image object with composite bands and count band
+    """
+    if method not in composite_methods:
+        raise ValueError('{} is not compatible, must be one of {}.'.format(method, sorted(composite_methods)))
+    if method == 'reduce' and reducers is None:
+        raise ValueError('reducers must be given for reduce method.')
+    if method == 'max_clear' and region is None and quality_property is None:
+        raise ValueError('region or quality_property must be given for max_clear method.')
+
+    bands = list(bands) if bands is not None else ee.Image(collection.first()).bandNames()
+    selected = collection.select(bands)
+    geometry = image_utils.region_to_geometry(region) if region is not None else None
+
+    if method == 'median':
+        image = selected.median()
+    elif method == 'percentile':
+        image = selected.reduce(ee.Reducer.percentile(list(percentiles)))
+    elif method == 'reduce':
+        image = selected.reduce(ee_utils.combine_reducers(reducers))
+    elif method == 'medoid':
+        image = medoid_mosaic(collection, bands)
+    elif method == 'greenest':
+        image = greenest_mosaic(collection, bands, index)
+    else:
+        image = max_clear_mosaic(collection, bands, geometry, scale or 30, quality_property)
+
+    # count of unmasked observations of first band
+    count = selected.select([0]).count().rename('count').toUint16()
+    image = image.addBands(count)
+
+    # reductions are in default WGS84 projection, set working projection so scale dependent operations are consistent
+    projection = ee.Image(collection.first()).select(0).projection() if crs is None else ee.Projection(crs)
+    if scale is not None:
+        projection = projection.atScale(scale)
+    image = image.setDefaultProjection(projection)
+    if geometry is not None:
+        image = image.clip(geometry)
+    hints = {'composite_method': method, 'tile_scale': tile_scale}
+    if scale is not None:
+        hints['scale'] = scale
+    return image.set(hints)
+
+def export_composite(image, folder, name, region, crs, scale, batch=False, max_workers=8, finalize=False):
+    """
+    function to export composite image by tiled local download or as batch export to google drive
+
+    Args
+    image - ee.Image object returned by composite
+    folder - local folder for tiled download or google drive folder for batch export
+    name - output name
+    region - extent of image
+    crs - output crs
+    scale - output_resolution
+    batch - bool, create ee.batch export task instead of downloading tiles default=False
+    max_workers - number of tiles downloaded at the same time default=8
+    finalize - bool, write tiled download as Cloud-Optimized GeoTIFF default=False
+
+    Returns
+    filepath of downloaded image or dict, name and ee.batch.Task that can be run with task_utils.run_tasks
+    """
+    if not batch:
+        return image_utils.download_img_tiled(image, folder, name, region, crs, scale, max_workers=max_workers,
+                                              finalize=finalize)
+    task = ee.batch.Export.image.toDrive(
+        image=image, description=name, folder=folder, fileNamePrefix=name,
+        region=image_utils.region_to_geometry(region), crs=crs, scale=scale, maxPixels=1e13,
+        fileFormat='GeoTIFF', formatOptions={'cloudOptimized': True})
+    return {name: task}
@@ -0,0 +1,184 @@
+# import modules
+import ee
+import functools
+import threading
+from concurrent.futures import Future
+import geeutil.rate_utils as rate_utils
+
+
+# define global variables
+# options used when earth engine is initialized on first use, set with configure
+init_options = {}
+
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def configure(project=None, url=None, credentials=None, **kwargs):
+    """
+    function to set options used when earth engine is initialized on first use
+
+    Args
+    project - google cloud project id default=None
+    url - earth engine api url default=None
+    credentials - credentials object default=None and persistent credentials are used
+    kwargs - other keyword arguments passed to ee.Initialize
+    """
+    init_options.clear()
+    init_options.update(kwargs, project=project, url=url, credentials=credentials)
+
+def is_initialized():
+    """
+    function to check whether earth engine has been initialized by geeutil or by calling ee.Initialize directly
+
+    Returns
+    bool
+    """
+    if _initialized:
+        return True
+    check = getattr(ee.data, 'is_initialized', None)
+    if callable(check):
+        return check()
+    return getattr(ee.data, '_initialized', False)
+
+def initialize(project=None, url=None, credentials=None, force=False, **kwargs):
+    """
+    function to initialize earth engine once for all geeutil modules
+
+    Args
+    project - google cloud project id default=None and project set with configure is used
+    url - earth engine api url default=None and url set with configure is used
+    credentials - credentials object default=None and persistent credentials are used
+    force - bool, initialize again if earth engine is already initialized default=False
+    kwargs - other keyword arguments passed to ee.Initialize
+    """
+    global _initialized
+    with _init_lock:
+        if is_initialized() and not force:
+            _initialized = True
+            return
+        options = dict(init_options)
+        options.update({k: v for k, v in dict(kwargs, project=project, url=url, credentials=credentials).items()
+                        if v is not None})
+        credentials = options.pop('credentials', None) or 'persistent'
+        url = options.pop('url', None)
+        options = {k: v for k, v in options.items() if v is not None}
+        ee.Initialize(credentials, url, **options)
+        _initialized = True
+
+def requires_ee(function):
+    """
+    decorator that initializes earth engine before function is called if it has not been initialized
+
+    Args
+    function - function that creates earth engine objects
+
+    Returns
+    wrapped function
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _initialized:
+            initialize()
+        return function(*args, **kwargs)
+    return wrapper
+
+@requires_ee
+def get_info(values):
+    """
+    function to fetch many computed values in a single request instead of one getInfo call per value
+
+    Args
+    values - dict of str keys and ee.ComputedObject values, list of ee.ComputedObject or single ee.ComputedObject
+
+    Returns
+    dict, list or client-side value matching values
+    """
+    if isinstance(values, ee.ComputedObject):
+        return rate_utils.call('info', values.getInfo)
+    if isinstance(values, dict):
+        return rate_utils.call('info', ee.Dictionary(values).getInfo) if values else {}
+    return rate_utils.call('info', ee.List(list(values)).getInfo) if values else []
+
+def combine_reducers(reducers):
+    """
+    function to combine reducers into one ee.Reducer with shared inputs
+
+    Args
+    reducers - ee.Reducer, reducer name eg. 'mean' or list of names and ee.Reducer objects
+
+    Returns
+    ee.Reducer object
+    """
+    if isinstance(reducers, (str, ee.Reducer)):
+        reducers = [reducers]
+    reducers = [getattr(ee.Reducer, r)() if isinstance(r, str) else r for r in reducers]
+    combined = reducers[0]
+    for reducer in reducers[1:]:
+        combined = combined.combine(reducer, sharedInputs=True)
+    return combined
+
+
+class InfoBatch:
+    """
+    class to collect computed values, eg. band names, scene counts, dates and footprints, and resolve them
+    in a single request. Can be used as a context manager that resolves pending values on exit
+
+    eg.
+    with InfoBatch() as batch:
+        n_scenes = batch.add(collection.size())
+        bands = batch.add(image.bandNames())
+    n_scenes.result()
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._futures = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.resolve()
+        return False
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, value, key=None):
+        """
+        function to add computed value to batch
+
+        Args
+        value - ee.ComputedObject
+        key - str, key of value in dict returned by resolve default=None and a key is generated
+
+        Returns
+        concurrent.futures.Future set with client-side value when batch is resolved
+        """
+        key = str(key) if key is not None else 'value_{}'.format(len(self._futures))
+        if key in self._futures:
+            raise ValueError(key + ' has already been added to batch.')
+        future = Future()
+        self._pending[key] = value
+        self._futures[key] = future
+        return future
+
+    def resolve(self):
+        """
+        function to fetch all pending values in one request
+
+        Returns
+        dict, key and client-side value for values resolved by this call
+        """
+        pending, self._pending = self._pending, {}
+        try:
+            results = get_info(pending)
+        except Exception as e:
+            for key in pending:
+                self._futures[key].set_exception(e)
+            raise
+        for key, value in results.items():
+            self._futures[key].set_result(value)
+        return results
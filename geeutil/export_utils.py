@@ -0,0 +1,189 @@
+# import modules
+import ee
+import os
+import json
+import time
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import geeutil.ee_utils as ee_utils
+import geeutil.image_utils as image_utils
+import geeutil.task_utils as task_utils
+
+
+# define global variables
+# default maximum uncompressed bytes and pixels per side of batch export shards
+max_export_bytes = 4 * 1024 ** 3
+max_export_dim = 32768
+
+
+def plan_shards(estimate, name, mode='download', max_shard_bytes=None, max_shard_dim=None):
+    """
+    function to split pixel grid of estimate into shards sized for direct download or batch export, shards are named
+    name_r000_c000 by row and column so the same request always gives the same shards
+
+    Args
+    estimate - dict returned by image_utils.estimate_size
+    name - output name shard names are prefixed with
+    mode - 'download' or 'export' default='download'
+    max_shard_bytes - maximum uncompressed bytes per shard default=None and image_utils.max_request_bytes is used
+        for downloads and max_export_bytes for exports
+    max_shard_dim - maximum pixels per shard side default=None and image_utils.max_request_dim is used for downloads
+        and max_export_dim for exports
+
+    Returns
+    list of dicts, tiles returned by image_utils.split_pixel_grid with shard name
+    """
+    if mode not in ('download', 'export'):
+        raise ValueError(mode + ' is not compatible, must be download or export.')
+    if mode == 'download':
+        max_shard_bytes = max_shard_bytes or image_utils.max_request_bytes
+        max_shard_dim = max_shard_dim or image_utils.max_request_dim
+    else:
+        max_shard_bytes = max_shard_bytes or max_export_bytes
+        max_shard_dim = max_shard_dim or max_export_dim
+
+    shards = image_utils.split_pixel_grid(estimate['grid'], estimate['bytes_per_pixel'], max_shard_bytes, max_shard_dim)
+    for shard in shards:
+        shard['name'] = '{}_r{:03d}_c{:03d}'.format(name, shard['row'], shard['col'])
+    return shards
+
+
+class ShardManifest:
+    """
+    class to record finished shards in a json file so reruns skip them, the file is rewritten atomically after
+    each update and can be shared by threads of one process
+
+    Args
+    path - filepath of manifest json
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.shards = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.shards = json.load(f).get('shards', {})
+
+    def is_done(self, name):
+        """
+        function to return True if shard is recorded as done
+        """
+        return self.shards.get(name, {}).get('state') == 'done'
+
+    def mark_done(self, name, **info):
+        """
+        function to record shard as done with optional info eg. path or task id
+        """
+        with self._lock:
+            self.shards[name] = dict(info, state='done', finished=time.time())
+            self._save()
+
+    def _save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'shards': self.shards}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def shard_export_task(ee_image, shard, crs, folder, bucket=None):
+    """
+    function to create batch export task of shard to google drive or cloud storage
+
+    Args
+    ee_image - ee.Image object
+    shard - dict returned by plan_shards
+    crs - output crs
+    folder - google drive folder or cloud storage path prefix
+    bucket - cloud storage bucket default=None and shard is exported to google drive
+
+    Returns
+    ee.batch.Task
+    """
+    params = {
+        'image': ee_image,
+        'description': shard['name'],
+        'crs': crs,
+        'crsTransform': shard['crs_transform'],
+        'dimensions': '{}x{}'.format(shard['width'], shard['height']),
+        'maxPixels': shard['width'] * shard['height'] + 1,
+        'fileFormat': 'GeoTIFF',
+    }
+    if bucket is None:
+        return ee.batch.Export.image.toDrive(folder=folder, fileNamePrefix=shard['name'], **params)
+    prefix = '/'.join(p for p in (folder, shard['name']) if p)
+    return ee.batch.Export.image.toCloudStorage(bucket=bucket, fileNamePrefix=prefix, **params)
+
+@ee_utils.requires_ee
+def export_sharded(ee_image, region, crs, scale, name, folder, mode='download', manifest_path=None, max_shard_bytes=None,
+                   max_shard_dim=None, max_workers=8, max_concurrent=10, bucket=None, verbose=False):
+    """
+    function to estimate size of ee.Image over region, split it into named shards and download or export each shard,
+    finished shards are recorded in a manifest and skipped when the export is run again
+
+    Args
+    ee_image - ee.Image object
+    region - extent of image
+    crs - output crs
+    scale - output_resolution
+    name - output name, shards are named name_r000_c000
+    folder - local folder for downloads, google drive folder or cloud storage prefix for exports
+    mode - 'download' to fetch shards with getDownloadUrl or 'export' to run batch tasks default='download'
+    manifest_path - filepath of manifest default=None and name_manifest.json in folder is used for downloads and in
+        the working directory for exports
+    max_shard_bytes, max_shard_dim - shard size limits, see plan_shards
+    max_workers - number of shards downloaded at the same time default=8
+    max_concurrent - number of export tasks running at once default=10
+    bucket - cloud storage bucket for exports default=None and shards are exported to google drive
+    verbose - bool, print progress default=False
+
+    Returns
+    dict, with size estimate, number of shards, skipped shards, completed shards and failed shards with errors
+    """
+    estimate = image_utils.estimate_size(ee_image, region, crs, scale)
+    shards = plan_shards(estimate, name, mode, max_shard_bytes, max_shard_dim)
+    if manifest_path is None:
+        manifest_path = os.path.join(folder if mode == 'download' else '', name + '_manifest.json')
+    manifest = ShardManifest(manifest_path)
+
+    todo = [s for s in shards if not manifest.is_done(s['name'])]
+    if verbose:
+        print('{} shards, {:.1f} MB, {} already done'.format(
+            len(shards), estimate['bytes'] / 1e6, len(shards) - len(todo)))
+
+    failed = {}
+    if mode == 'download':
+        os.makedirs(folder, exist_ok=True)
+        bands = estimate['bands']
+
+        def download(shard):
+            path = os.path.join(folder, shard['name'] + '.tif')
+            image_utils.download_tile(ee_image, shard, bands, crs, path)
+            manifest.mark_done(shard['name'], path=path)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(download, shard): shard['name'] for shard in todo}
+            for future in as_completed(futures):
+                error = future.exception()
+                if error is not None:
+                    failed[futures[future]] = str(error)
+                elif verbose:
+                    print('downloaded ' + futures[future])
+    else:
+        # tasks are created by functions so failed tasks can be restarted by task_utils
+        tasks = {s['name']: functools.partial(shard_export_task, ee_image, s, crs, folder, bucket) for s in todo}
+
+        # record each shard as soon as its task finishes so an interrupted run can be resumed
+        def finish(shard_name, result):
+            if result['state'] == 'COMPLETED':
+                manifest.mark_done(shard_name, task_id=result['id'])
+            else:
+                failed[shard_name] = result['error'] or result['state']
+
+        task_utils.run_tasks(tasks, max_concurrent=max_concurrent, verbose=verbose, on_finish=finish)
+
+    return {'estimate': estimate, 'shards': len(shards), 'skipped': len(shards) - len(todo),
+            'completed': len(todo) - len(failed), 'failed': failed}
@@ -1,9 +1,15 @@
 # import modules 
 import ee
-import geopandas as gpd
 import json
+import geeutil.ee_utils as ee_utils
 
 
+# define global variables
+# geometry types that can be converted to ee.Geometry
+valid_geometry_types = {'Point', 'MultiPoint', 'LineString', 'MultiLineString', 'Polygon', 'MultiPolygon'}
+# default maximum estimated serialized size of feature chunks in bytes
+max_chunk_bytes = 4 * 1024 * 1024
+
 
 def shp_to_featureCollection(shapefile):
     """
@@ -14,6 +20,8 @@ def shp_to_featureCollection(shapefile):
     
     Returns
     ee.FeatureCollection object"""
+    import geopandas as gpd
+
     # read shapefile as gdf
     gdf = gpd.read_file(shapefile)
     # convert gdf to featureCollection with gdf_to_featureCollection
@@ -36,40 +44,195 @@ def buffer(buffer):
     return apply_buffer
 
 
-def gdf_to_featureCollection(gdf):
+def round_coordinates(coordinates, precision=None):
+    """
+    function to convert nested coordinate tuples to lists and optionally round coordinates
+
+    Args
+    coordinates - nested coordinates from __geo_interface__
+    precision - number of decimal places coordinates are rounded to default=None and coordinates are not rounded
+
+    Returns
+    nested list of coordinates
+    """
+    if isinstance(coordinates[0], (int, float)):
+        if precision is None:
+            return list(coordinates)
+        return [round(c, precision) for c in coordinates]
+    return [round_coordinates(c, precision) for c in coordinates]
+
+def geometry_to_ee(geometry, precision=None):
+    """
+    function to build ee.Geometry directly from GeoJSON-like geometry without a json round trip
+
+    Args
+    geometry - shapely geometry or any object with __geo_interface__, or GeoJSON geometry dict
+    precision - number of decimal places coordinates are rounded to default=None
+
+    Returns
+    ee.Geometry object
+    """
+    geo_json = geometry if isinstance(geometry, dict) else geometry.__geo_interface__
+    if geo_json['type'] not in valid_geometry_types:
+        raise ValueError(geo_json['type'] + ' is not compatible, must be one of ' + ', '.join(sorted(valid_geometry_types)))
+    coordinates = round_coordinates(geo_json['coordinates'], precision)
+    return getattr(ee.Geometry, geo_json['type'])(coordinates)
+
+def to_property(value):
+    """
+    function to convert dataframe value to json serializable feature property
+
+    Args
+    value - dataframe value
+
+    Returns
+    python int, float, str, bool or None
+    """
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    if value is None or isinstance(value, (int, float, str, bool)):
+        return value
+    return str(value)
+
+def gdf_to_features(gdf, columns=None, tolerance=None, precision=None, line_buffer=1500):
+    """
+    function to convert geopandas dataframe to list of ee.Feature objects and estimated serialized size of each feature
+
+    Args
+    gdf - geopandas dataframe
+    columns - list of attribute columns kept as feature properties default=None and no properties are kept
+    tolerance - simplification tolerance in units of gdf crs default=None and geometries are not simplified
+    precision - number of decimal places coordinates are rounded to default=None
+    line_buffer - distance in metres LineString and MultiLineString features are buffered by default=1500,
+        None and lines are not buffered
+
+    Returns
+    list of tuples, ee.Feature and size in bytes
+    """
+    # raise error if gdf contains geometry types that can't be converted
+    invalid = set(gdf.geom_type.dropna().unique()) - valid_geometry_types
+    if invalid:
+        raise ValueError('{} are not compatible, must be one of {}.'.format(sorted(invalid), sorted(valid_geometry_types)))
+
+    geometry = gdf.geometry
+    if tolerance is not None:
+        geometry = geometry.simplify(tolerance, preserve_topology=True)
+    geometry = geometry.to_crs(4326)
+    records = gdf[list(columns)].to_dict('records') if columns else [{}] * len(gdf)
+
+    features = []
+    for geom, record in zip(geometry, records):
+        if geom is None or geom.is_empty:
+            continue
+        geo_json = geom.__geo_interface__
+        coordinates = round_coordinates(geo_json['coordinates'], precision)
+        properties = {k: to_property(v) for k, v in record.items()}
+        feature = ee.Feature(getattr(ee.Geometry, geo_json['type'])(coordinates), properties)
+        if line_buffer is not None and geo_json['type'] in {'LineString', 'MultiLineString'}:
+            feature = feature.buffer(line_buffer)
+        # estimate serialized size from coordinates and properties
+        size = len(json.dumps(coordinates)) + len(json.dumps(properties))
+        features.append((feature, size))
+    return features
+
+def chunk_features(features, max_bytes):
+    """
+    function to split features into chunks with estimated serialized size smaller than max_bytes
+
+    Args
+    features - list of tuples of ee.Feature and size returned by gdf_to_features
+    max_bytes - maximum estimated size of chunk in bytes
+
+    Returns
+    list of lists of ee.Feature
+    """
+    chunks, chunk, chunk_bytes = [], [], 0
+    for feature, size in features:
+        if chunk and chunk_bytes + size > max_bytes:
+            chunks.append(chunk)
+            chunk, chunk_bytes = [], 0
+        chunk.append(feature)
+        chunk_bytes += size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+@ee_utils.requires_ee
+def gdf_to_featureCollection_chunks(gdf, max_bytes=max_chunk_bytes, columns=None, tolerance=None, precision=None,
+                                    line_buffer=1500):
+    """
+    function to read a geopandas dataframe as a list of ee.featureCollection objects each smaller than max_bytes,
+    chunks can be sent in separate requests or exported to assets with export_featureCollection_to_assets
+
+    Args
+    gdf - geopandas dataframe to be read as featureCollection GEE objects
+    max_bytes - maximum estimated serialized size of each chunk default=max_chunk_bytes
+    columns, tolerance, precision, line_buffer - passed to gdf_to_features
+
+    Returns
+    list of ee.FeatureCollection objects
+    """
+    features = gdf_to_features(gdf, columns, tolerance, precision, line_buffer)
+    return [ee.FeatureCollection(chunk) for chunk in chunk_features(features, max_bytes)]
+
+@ee_utils.requires_ee
+def gdf_to_featureCollection(gdf, columns=None, tolerance=None, precision=None, line_buffer=1500):
     '''
     function to read a geopandas dataframe as a ee.featureCollection
     Args
     gdf - geopandas dataframe to be read as featureCollection GEE object
+    columns - list of attribute columns kept as feature properties default=None and no properties are kept
+    tolerance - simplification tolerance in units of gdf crs default=None and geometries are not simplified
+    precision - number of decimal places coordinates are rounded to default=None
+    line_buffer - distance in metres LineString and MultiLineString features are buffered by default=1500
     
     Returns
-    ee.FeatureCollection object
+    ee.FeatureCollection object, large dataframes should be split with gdf_to_featureCollection_chunks or uploaded
+        with export_featureCollection_to_assets and merge_assets so no single request is too large
     '''
-    # raise error if gdf is not LineString or Polygon
-    valid_geometry = {'LineString','Polygon'}
-    if gdf.geom_type[0] not in valid_geometry:
-        raise ValueError('Shapefile must be LineString or Polygon.')
-
-    #convert to json_dict
-    if gdf.geom_type[0] == 'LineString':
-        #gdf = gdf.buffer(1500)
-        gdf = gdf.to_crs(4326)
-    else:
-        gdf = gdf.to_crs(4326)
-    geo_json = gdf.to_json()
-    json_dict = json.loads(geo_json)
-    features = []
-    # iterate over json features convert ee.Geometries and read as ee.Feature
-    for feature in json_dict['features']:
-        # derive ee.Geometry type from json_dict
-        if feature['geometry']['type'] == 'LineString':
-            line = ee.Feature(ee.Geometry.LineString(feature['geometry']['coordinates']))
-            features.append(line.buffer(1500))
-        if feature['geometry']['type'] == 'Polygon':
-            features.append(ee.Feature(ee.Geometry.Polygon(feature['geometry']['coordinates'])))
-    
-    return ee.FeatureCollection(features)
+    features = gdf_to_features(gdf, columns, tolerance, precision, line_buffer)
+    return ee.FeatureCollection([f for f, _ in features])
+
+@ee_utils.requires_ee
+def export_featureCollection_to_assets(gdf, asset_id, max_bytes=max_chunk_bytes, columns=None, tolerance=None,
+                                       precision=None, line_buffer=1500):
+    """
+    function to create export tasks that upload geopandas dataframe as chunked table assets, tasks can be run with
+    task_utils.run_tasks and the uploaded chunks read with merge_assets
+
+    Args
+    gdf - geopandas dataframe
+    asset_id - asset id prefix, chunks are exported to asset_id_000, asset_id_001...
+    max_bytes - maximum estimated serialized size of each chunk default=max_chunk_bytes
+    columns, tolerance, precision, line_buffer - passed to gdf_to_features
 
+    Returns
+    dict, asset id and ee.batch.Task
+    """
+    chunks = gdf_to_featureCollection_chunks(gdf, max_bytes, columns, tolerance, precision, line_buffer)
+    tasks = {}
+    for i, chunk in enumerate(chunks):
+        chunk_id = '{}_{:03d}'.format(asset_id, i)
+        tasks[chunk_id] = ee.batch.Export.table.toAsset(
+            collection=chunk, description=chunk_id.split('/')[-1], assetId=chunk_id)
+    return tasks
+
+@ee_utils.requires_ee
+def merge_assets(asset_ids):
+    """
+    function to merge table assets into one ee.FeatureCollection server-side
+
+    Args
+    asset_ids - list of table asset ids
+
+    Returns
+    ee.FeatureCollection object
+    """
+    return ee.FeatureCollection([ee.FeatureCollection(a) for a in asset_ids]).flatten()
+
+@ee_utils.requires_ee
 def item_to_featureCollection(dict_item):
     """
     function to return ee.FeatureCollection from dict_item generated from pandas iterfeatures
@@ -80,21 +243,4 @@ def item_to_featureCollection(dict_item):
     returns 
     ee.FeatureCollection object
     """
-
-    # raise error if gdf is not LineString or Polygon
-    valid_geometry = {'LineString','Polygon','Point'}
-    if dict_item['geometry']['type'] not in valid_geometry:
-        raise ValueError('Shapefile must be LineString or Polygon.')
-
-    features = []
-
-    if dict_item['geometry']['type'] == 'Polygon':
-        ee_geometry = ee.Geometry.Polygon(dict_item['geometry']['coordinates'])
-    if dict_item['geometry']['type'] == 'LineString':
-        ee_geometry = ee.Geometry.LineString(dict_item['geometry']['coordinates'])
-    if dict_item['geometry']['type'] == 'Point':
-        ee_geometry = ee.Geometry.Point(dict_item['geometry']['coordinates'])
-    
-    features.append(ee.Feature(ee_geometry))
-
-    return ee.FeatureCollection(features)
\ No newline at end of file
+    return ee.FeatureCollection([ee.Feature(geometry_to_ee(dict_item['geometry']))])
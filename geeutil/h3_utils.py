@@ -1,25 +1,18 @@
-import pandas as pd
-import geopandas as gpd
-
-
 def get_children(index, gdf):
     """
     function that returns geopandas dataframe containing children h3 cells
     
     args
     index - index or list of indexes that children will be returned for
-    gdf - h3 geodataframe
+    gdf - h3 geodataframe or compact h3 dataframe returned by to_compact or read_compact
 
     returns geodataframe with children cells
     """
-    if index != list:
+    index = match_index(index, gdf)
+    if not isinstance(index, list):
         df = gdf.query('index == @index or parent_id == @index')
     else:
-        df_list = []
-        for i in index:
-            i_df = gdf.query('index == @i or parent_id == @i')
-            df_list.append(i_df)
-        df = pd.concat(df_list)
+        df = gdf[gdf['index'].isin(index) | gdf['parent_id'].isin(index)]
     return df
 
 def get_index_by_res(res, gdf):
@@ -28,7 +21,7 @@ def get_index_by_res(res, gdf):
 
     args
     res - resolution that indexes will be returned for
-    gdf - h3 geodataframe
+    gdf - h3 geodataframe or compact h3 dataframe
 
     returns list of indexes as specified resolution 
     """
@@ -41,12 +34,13 @@ def get_resolution(index, gdf):
     
     args
     index - h3 cell index
-    gdf - h3 geodataframe
+    gdf - h3 geodataframe or compact h3 dataframe
     
     returns - resolution of h3 cell
     """
+    index = match_index(index, gdf)
     df = gdf.query('index == @index')
-    return int(df['resolution'])
+    return int(df['resolution'].iloc[0])
 
 
 def get_child_cells(gdf, index, resolution=None): # if resolution is none all children returned at all resolutions. 
@@ -54,12 +48,15 @@ def get_child_cells(gdf, index, resolution=None): # if resolution is none all ch
     function to get children cells for a given h3 index
 
     args 
-    gdf - h3 geodataframe
+    gdf - h3 geodataframe or compact h3 dataframe
     index - index that children will be found for
     resolution - default = None, if resolution is specified only children at that resolution will be returned
 
     returns geodataframe containing children cells
     """
+    import pandas as pd
+
+    index = match_index(index, gdf)
     # get index resolution
     index_res = get_resolution(index, gdf)
     # get children of cell specified by index param
@@ -67,7 +64,7 @@ def get_child_cells(gdf, index, resolution=None): # if resolution is none all ch
     # get children of finer resolutions
     if index_res == 5:
         res = [6,7]
-    if index_res == 6:
+    elif index_res == 6:
         res = [7]
     else:
         res = [5,6,7]
@@ -88,4 +85,299 @@ def get_child_cells(gdf, index, resolution=None): # if resolution is none all ch
     
     return df
 
+def cell_to_int(index):
+    """
+    function to convert h3 cell index or list of indexes from hex string to integer
+
+    args
+    index - h3 cell index as hex string or integer, or list or array of indexes
+
+    returns numpy uint64 array of cell indexes
+    """
+    import numpy as np
+
+    if isinstance(index, (str, int, np.integer)):
+        index = [index]
+    values = np.asarray(index)
+    if values.dtype.kind in 'iu':
+        return values.astype(np.uint64)
+    return np.array([int(i, 16) if isinstance(i, str) else 0 for i in values], dtype=np.uint64)
+
+def int_to_cell(values):
+    """
+    function to convert integer h3 cell indexes to hex strings
+
+    args
+    values - integer cell index or array of indexes
+
+    returns list of cell indexes as hex strings
+    """
+    import numpy as np
+
+    return [format(int(v), 'x') for v in np.atleast_1d(values)]
+
+
+def is_compact(gdf):
+    """
+    function to check if h3 dataframe stores cell indexes as integers
+
+    args
+    gdf - h3 geodataframe or compact h3 dataframe
+
+    returns bool
+    """
+    return gdf['index'].dtype.kind in 'iu'
+
+def match_index(index, gdf):
+    """
+    function to convert h3 cell index or list of indexes to the form stored in gdf
+
+    args
+    index - h3 cell index or list of indexes as hex strings or integers
+    gdf - h3 geodataframe or compact h3 dataframe
+
+    returns index or list of indexes as integers if gdf is compact, else as hex strings
+    """
+    values = cell_to_int(index)
+    if is_compact(gdf):
+        values = [int(v) for v in values]
+    else:
+        values = int_to_cell(values)
+    return values if isinstance(index, list) else values[0]
+
+def to_compact(gdf, geometry=False):
+    """
+    function to convert h3 geodataframe to compact dataframe with uint64 index and parent_id, parent_id is 0 for
+    cells without parent, and uint8 resolution
+
+    args
+    gdf - h3 geodataframe
+    geometry - bool, keep geometry as WKB bytes default=False and geometry can be rebuilt with to_gdf
+
+    returns pandas dataframe
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = pd.DataFrame({
+        'index': cell_to_int(gdf['index'].to_numpy()),
+        'parent_id': cell_to_int(gdf['parent_id'].to_numpy()),
+        'resolution': gdf['resolution'].to_numpy().astype(np.uint8)})
+    if geometry:
+        df['geometry'] = gdf.geometry.to_wkb().to_numpy()
+    return df
+
+def write_compact(gdf, path, geometry=False):
+    """
+    function to write h3 geodataframe in compact form, files ending .parquet are written as parquet,
+    other files as uncompressed arrow ipc files with a single record batch that can be memory-mapped without copying
+
+    args
+    gdf - h3 geodataframe or compact h3 dataframe
+    path - output filepath
+    geometry - bool, keep geometry as WKB bytes default=False
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    df = gdf if is_compact(gdf) else to_compact(gdf, geometry)
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        # one record batch so each column is one contiguous buffer read_compact can wrap without joining chunks
+        feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), path, compression='uncompressed',
+                              chunksize=max(1, len(df)))
+
+def read_compact(path, columns=None, memory_map=True):
+    """
+    function to read compact h3 dataframe written by write_compact, arrow ipc files are memory-mapped and integer
+    columns are wrapped without copying so processes opening the same file share the same pages
+
+    args
+    path - filepath of compact h3 file
+    columns - list of columns to read default=None and all columns are read
+    memory_map - bool, memory-map file default=True
+
+    returns compact pandas dataframe
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+
+    if path.endswith('.parquet'):
+        return pq.read_table(path, columns=columns, memory_map=memory_map).to_pandas()
+    table = feather.read_table(path, columns=columns, memory_map=memory_map)
+    data = {}
+    for name in table.column_names:
+        column = table.column(name)
+        fixed_width = pa.types.is_integer(column.type) or pa.types.is_floating(column.type)
+        if column.num_chunks == 1 and column.null_count == 0 and fixed_width:
+            # numpy array over the arrow buffer, no copy
+            data[name] = column.chunk(0).to_numpy(zero_copy_only=True)
+        else:
+            # geometry WKB and files with several record batches are copied
+            data[name] = column.to_numpy()
+    return pd.DataFrame(data, columns=table.column_names, copy=False)
+
+def cell_boundaries(index):
+    """
+    function to build polygon geometries for h3 cells with the h3 library
+
+    args
+    index - list or array of h3 cell indexes
+
+    returns list of shapely polygons in EPSG:4326
+    """
+    import h3
+    from shapely.geometry import Polygon
+
+    cells = int_to_cell(cell_to_int(index))
+    if hasattr(h3, 'cell_to_boundary'):
+        boundaries = [h3.cell_to_boundary(c) for c in cells]
+    else:
+        boundaries = [h3.h3_to_geo_boundary(c) for c in cells]
+    # h3 returns lat, lng pairs
+    return [Polygon([(lng, lat) for lat, lng in b]) for b in boundaries]
+
+def to_gdf(df):
+    """
+    function to convert compact h3 dataframe to h3 geodataframe with hex string indexes and polygon geometry,
+    geometry is read from WKB if stored, else rebuilt from cell indexes
+
+    args
+    df - compact h3 dataframe
+
+    returns geodataframe
+    """
+    import geopandas as gpd
+
+    parents = [p if v else None for p, v in zip(int_to_cell(df['parent_id'].to_numpy()), df['parent_id'].to_numpy())]
+    if 'geometry' in df:
+        geometry = gpd.GeoSeries.from_wkb(df['geometry'].to_numpy(), crs=4326)
+    else:
+        geometry = gpd.GeoSeries(cell_boundaries(df['index'].to_numpy()), crs=4326)
+    return gpd.GeoDataFrame({
+        'index': int_to_cell(df['index'].to_numpy()),
+        'parent_id': parents,
+        'resolution': df['resolution'].to_numpy()}, geometry=geometry.to_numpy(), crs=4326)
+
+
+class H3Index:
+    """
+    class for a prebuilt parent/child index of h3 geodataframe. Cells are stored as sorted uint64 arrays with the
+    position of each cell's parent and CSR-style child offsets, so children, descendants and resolution lookups are
+    vectorized array operations instead of dataframe queries
+
+    args
+    gdf - h3 geodataframe or compact h3 dataframe with index, parent_id and resolution columns
+    """
+
+    def __init__(self, gdf):
+        import numpy as np
+
+        self.gdf = gdf
+        cells = cell_to_int(gdf['index'].to_numpy())
+        # sort cells so cells can be found with searchsorted, rows maps sorted positions to gdf rows
+        self.rows = np.argsort(cells, kind='stable')
+        self.cells = cells[self.rows]
+        self.resolutions = gdf['resolution'].to_numpy().astype(np.uint8)[self.rows]
+
+        # position of parent of each cell, -1 if parent is not in gdf
+        parents = cell_to_int(gdf['parent_id'].to_numpy())[self.rows]
+        parent_pos = np.searchsorted(self.cells, parents)
+        parent_pos[parent_pos >= len(self.cells)] = 0
+        self.parents = np.where(self.cells[parent_pos] == parents, parent_pos, -1)
+
+        # children of cell at position p are child_positions[offsets[p]:offsets[p + 1]]
+        has_parent = np.nonzero(self.parents >= 0)[0]
+        order = np.argsort(self.parents[has_parent], kind='stable')
+        self.child_positions = has_parent[order]
+        counts = np.bincount(self.parents[has_parent], minlength=len(self.cells))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def positions(self, index):
+        """
+        function to return sorted positions of cells
+
+        args
+        index - h3 cell index or list of indexes as hex strings or integers
+
+        returns numpy array of positions
+        """
+        import numpy as np
+
+        values = cell_to_int(index)
+        pos = np.searchsorted(self.cells, values)
+        found = pos < len(self.cells)
+        found[found] = self.cells[pos[found]] == values[found]
+        if not found.all():
+            raise KeyError('h3 cells not found: {}'.format(int_to_cell(values[~found])[:10]))
+        return pos
+
+    def _children_positions(self, pos):
+        import numpy as np
+
+        starts = self.offsets[pos]
+        lengths = self.offsets[pos + 1] - starts
+        # gather all child ranges in one operation
+        steps = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return self.child_positions[np.repeat(starts, lengths) + steps]
+
+    def children(self, index):
+        """
+        function to return direct children of cells
+
+        args
+        index - h3 cell index or list of indexes
+
+        returns numpy uint64 array of child cell indexes
+        """
+        return self.cells[self._children_positions(self.positions(index))]
+
+    def descendants(self, index, resolution=None):
+        """
+        function to return all descendants of cells, excluding the cells themselves
+
+        args
+        index - h3 cell index or list of indexes
+        resolution - default = None, if resolution is specified only descendants at that resolution are returned
+
+        returns numpy uint64 array of descendant cell indexes
+        """
+        import numpy as np
+
+        frontier = np.unique(self.positions(index))
+        found = []
+        while frontier.size:
+            frontier = self._children_positions(frontier)
+            if resolution is not None:
+                # stop once resolution has been reached
+                frontier = frontier[self.resolutions[frontier] <= resolution]
+                found.append(frontier[self.resolutions[frontier] == resolution])
+            else:
+                found.append(frontier)
+        pos = np.unique(np.concatenate(found)) if found else np.array([], dtype=np.int64)
+        return self.cells[pos]
+
+    def resolution(self, index):
+        """
+        function to return resolution of cells
+
+        args
+        index - h3 cell index or list of indexes
+
+        returns numpy uint8 array of resolutions
+        """
+        return self.resolutions[self.positions(index)]
+
+    def to_gdf(self, index):
+        """
+        function to return rows of geodataframe for cells
+
+        args
+        index - h3 cell index or list of indexes
 
+        returns geodataframe of cells
+        """
+        return self.gdf.iloc[self.rows[self.positions(index)]]
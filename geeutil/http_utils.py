@@ -0,0 +1,161 @@
+# import modules
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+import geeutil.rate_utils as rate_utils
+
+
+# define global variables
+# chunk sizes in bytes used when streaming downloads to file
+min_chunk_size = 256 * 1024
+max_chunk_size = 16 * 1024 * 1024
+# number of pooled connections kept alive per host
+pool_size = 32
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    function to return shared requests.Session with pooled keep-alive connections, session is created on first call
+
+    Returns
+    requests.Session object
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+    return _session
+
+def adaptive_chunk_size(content_length):
+    """
+    function to return chunk size for streamed download, chunks grow with the size of the response
+
+    Args
+    content_length - int, size of response in bytes or None if unknown
+
+    Returns
+    int, chunk size in bytes
+    """
+    if not content_length:
+        return min_chunk_size
+    return int(min(max_chunk_size, max(min_chunk_size, content_length // 64)))
+
+def response_error(response):
+    """
+    function to return error message from failed response, earth engine returns errors as json
+
+    Args
+    response - requests.Response object
+
+    Returns
+    str, error message
+    """
+    try:
+        return response.json()["error"]["message"]
+    except Exception:
+        return 'HTTP {}: {}'.format(response.status_code, response.text[:200])
+
+def retry_after(response):
+    """
+    function to return seconds to wait before retrying from Retry-After header of response
+
+    Args
+    response - requests.Response object
+
+    Returns
+    float, seconds, 0 if header is missing or invalid
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return 0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0
+
+def download_file(url, path, session=None, chunk_size=None, max_retries=3, timeout=300):
+    """
+    function to stream url to file, data is written to temp file that is renamed to path once the byte count is checked.
+    Dropped connections are resumed with Range requests where the server supports them, otherwise restarted.
+    Requests are rate limited with rate_utils and rate limited or unavailable responses are retried with backoff after
+    waiting for their Retry-After header
+
+    Args
+    url - url to download
+    path - output filepath
+    session - requests.Session, default=None and shared session from get_session is used
+    chunk_size - chunk size in bytes, default=None and chunk size is set from response size
+    max_retries - number of times dropped, incomplete, rate limited or unavailable transfers are retried default=3
+    timeout - seconds to wait for server response default=300
+
+    Returns
+    int, number of bytes written to path
+    """
+    if session is None:
+        session = get_session()
+    part_path = path + '.part'
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+    accepts_ranges = False
+    error = None
+    wait = 0
+    for attempt in range(max_retries + 1):
+        # resume from end of partial file if server accepts range requests
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) and accepts_ranges else 0
+        headers = {'Range': 'bytes={}-'.format(offset)} if offset else {}
+        expected = None
+        if attempt:
+            rate_utils.count('http', 'retried')
+            time.sleep(wait + rate_utils.backoff_delay(attempt - 1))
+            wait = 0
+        rate_utils.throttle('http')
+        try:
+            with session.get(url, stream=True, headers=headers, timeout=timeout) as response:
+                if response.status_code == 429 or response.status_code >= 500:
+                    error = IOError(response_error(response))
+                    wait = retry_after(response)
+                    continue
+                if response.status_code not in (200, 206):
+                    raise IOError(response_error(response))
+                accepts_ranges = response.headers.get('Accept-Ranges') == 'bytes'
+                # server ignored range request so file is written from start
+                if response.status_code == 200:
+                    offset = 0
+                length = response.headers.get('Content-Length')
+                if length is not None and 'Content-Encoding' not in response.headers:
+                    expected = offset + int(length)
+
+                with open(part_path, 'ab' if offset else 'wb') as fd:
+                    for chunk in response.iter_content(chunk_size=chunk_size or adaptive_chunk_size(expected)):
+                        fd.write(chunk)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            error = e
+            continue
+
+        # check byte count before moving file to path
+        size = os.path.getsize(part_path)
+        if expected is not None and size != expected:
+            error = IOError('Incomplete download, received {} of {} bytes.'.format(size, expected))
+            continue
+        os.replace(part_path, path)
+        return size
+
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    rate_utils.count('http', 'failed')
+    raise IOError('Download failed after {} attempts: {}'.format(max_retries + 1, error))
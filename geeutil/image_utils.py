@@ -1,13 +1,22 @@
 # import modules
 import ee
-import time
 import os
-import requests
-from osgeo import gdal
+import io
+import math
+import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import geeutil.ee_utils as ee_utils
+import geeutil.http_utils as http_utils
+import geeutil.rate_utils as rate_utils
+import geeutil.task_utils as task_utils
 
 
-# Initialize GEE
-ee.Initialize()
+# define global variables
+# maximum uncompressed size in bytes and pixels per side of a single getDownloadUrl request
+max_request_bytes = 32 * 1024 * 1024
+max_request_dim = 10000
 
 
 def rename_img_bands(img_bands, band_names):
@@ -42,14 +51,11 @@ def resample_image(image, crs='EPSG: 2193', pixel_size=20):
 
 def run_task(task, mins):
     """
-    function to run ee.batch.export and check status of task every number of minutes specified by mins
+    function to run ee.batch.export and check status of task every number of minutes specified by mins,
+    use task_utils.run_tasks to run many tasks at once
     """
 
-    secs = mins * 60
-    task.start()
-    while task.active():
-        print(task.status())
-        time.sleep(secs)
+    return task_utils.run_tasks([task], max_concurrent=1, poll_interval=mins * 60, max_retries=0, verbose=True)
 
 def set_band_names(image, band_names):
     """
@@ -57,6 +63,8 @@ def set_band_names(image, band_names):
     :param image: input image
     :param band_names: list of band names
     """
+    from osgeo import gdal
+
     data = gdal.Open(image, gdal.GA_Update)
     for i in range(len(band_names)):
         band = i + 1
@@ -70,7 +78,9 @@ def set_band_names(image, band_names):
             raise exception("Could not open the image band: ", band)
 
 
-def download_img_local(ee_image, folder, name, region, crs, scale, format='GEO_TIFF'):
+@ee_utils.requires_ee
+def download_img_local(ee_image, folder, name, region, crs, scale, format='GEO_TIFF', tiled=False, bands=None,
+                       finalize=False, return_stats=False, **tile_kwargs):
     """
     function to get download url from ee.Image
     
@@ -81,14 +91,25 @@ def download_img_local(ee_image, folder, name, region, crs, scale, format='GEO_T
     region - extent of image
     scale - output_resolution
     format - image format default GEO_TIFF
+    tiled - bool, if True region is split into tiles that are downloaded in parallel with download_img_tiled. Default=False
+    bands - list of band names default=None and band names are fetched from ee_image, pass band names resolved with
+        ee_utils.InfoBatch to avoid a request per image
+    finalize - bool, write band names and convert image to Cloud-Optimized GeoTIFF with finalize_geotiff. Default=False
+    return_stats - bool, also return finalize stats, see finalize_geotiff. Default=False
+    tile_kwargs - keyword arguments passed to download_img_tiled eg. max_workers, max_tile_bytes, output_format
 
     Returns
-    image downloaded to local folder specified
+    image downloaded to local folder specified, or tuple of image and finalize stats if return_stats is True,
+        stats are None if image isn't finalized
     """
-    
-    # get bandnames
 
-    bands = ee_image.bandNames().getInfo()
+    if tiled:
+        return download_img_tiled(ee_image, folder, name, region, crs, scale, bands=bands, finalize=finalize,
+                                  return_stats=return_stats, **tile_kwargs)
+
+    # get bandnames
+    if bands is None:
+        bands = ee_utils.get_info(ee_image.bandNames())
     #print(bands)
     params = {
         'bands': bands,
@@ -102,26 +123,47 @@ def download_img_local(ee_image, folder, name, region, crs, scale, format='GEO_T
 
     # define url
     try: 
-        url = ee_image.getDownloadUrl(params)
+        url = rate_utils.call('download_url', ee_image.getDownloadUrl, params)
     except Exception as e:
         print('Error occurred during download.')
         print(e)
         return
 
-    # get url 
-    response = requests.get(url, stream=True)
-    if response.status_code != 200:
+    # download file 
+    try:
+        http_utils.download_file(url, down_path)
+    except IOError as e:
         print('Error occurred during download.')
-        print(response.json()["error"]["message"])
+        print(e)
         return
 
-    # download file 
-    with open(down_path, 'wb') as fd:
-        for chunk in response.iter_content(chunk_size=1024):
-            fd.write(chunk)
-
     # set band names
-    set_band_names(down_path, bands)
+    stats = None
+    if finalize:
+        stats = finalize_geotiff(down_path, bands)
+    else:
+        set_band_names(down_path, bands)
+    return (down_path, stats) if return_stats else down_path
+
+def download_imgs_local(ee_images, folder, region, crs, scale, format='GEO_TIFF', finalize=False):
+    """
+    function to download many ee.Image objects, band names of all images are fetched in one request
+    
+    Args
+    ee_images - dict, file name and ee.Image object
+    folder - local folder name to save images to
+    region - extent of images
+    crs - output crs
+    scale - output_resolution
+    format - image format default GEO_TIFF
+    finalize - bool, convert images to Cloud-Optimized GeoTIFF with finalize_geotiff. Default=False
+
+    Returns
+    images downloaded to local folder specified
+    """
+    bands = ee_utils.get_info({name: img.bandNames() for name, img in ee_images.items()})
+    for name, img in ee_images.items():
+        download_img_local(img, folder, name, region, crs, scale, format, bands=bands[name], finalize=finalize)
 
 def set_nodata_val(image, no_data_val):
     """
@@ -131,6 +173,477 @@ def set_nodata_val(image, no_data_val):
     image - str, filepath to image requiring no_data value
     no_data_val - int, no data value to set
     """
+    from osgeo import gdal
+
     ds = gdal.OpenEx(image, gdal.GA_Update)
     for i in range(ds.RasterCount):
-        ds.GetRasterBand(i + 1).SetNoDataValue(no_data_val)
\ No newline at end of file
+        ds.GetRasterBand(i + 1).SetNoDataValue(no_data_val)
+
+
+@ee_utils.requires_ee
+def region_to_geometry(region):
+    """
+    function to return ee.Geometry from region passed to download functions
+    
+    Args
+    region - ee.Geometry, ee.Feature, ee.FeatureCollection, GeoJSON dict or list of polygon coordinates
+
+    Returns
+    ee.Geometry object
+    """
+    if isinstance(region, ee.Geometry):
+        return region
+    if isinstance(region, (ee.Feature, ee.FeatureCollection)):
+        return region.geometry()
+    if isinstance(region, dict):
+        return ee.Geometry(region)
+    return ee.Geometry.Polygon(region)
+
+def pixel_type_bytes(pixel_type):
+    """
+    function to return number of bytes per pixel for ee.PixelType dict returned by ee.Image.bandTypes().getInfo()
+    
+    Args
+    pixel_type - dict, pixel type with precision and optional min and max values
+
+    Returns
+    int, number of bytes per pixel
+    """
+    precision = pixel_type.get('precision')
+    if precision == 'double':
+        return 8
+    if precision == 'float':
+        return 4
+    # integer types use smallest type that holds range
+    min_val = pixel_type.get('min', -2 ** 63)
+    max_val = pixel_type.get('max', 2 ** 63 - 1)
+    for n_bytes in (1, 2, 4):
+        bits = 8 * n_bytes
+        if min_val >= 0 and max_val < 2 ** bits:
+            return n_bytes
+        if min_val >= -2 ** (bits - 1) and max_val < 2 ** (bits - 1):
+            return n_bytes
+    return 8
+
+def bytes_per_pixel(types, bands):
+    """
+    function to return uncompressed bytes per pixel of bands, GeoTIFF stores every band at the widest band type
+    so all bands are counted at the size of the widest type
+    
+    Args
+    types - dict of band name and pixel type returned by ee.Image.bandTypes().getInfo()
+    bands - list of band names
+
+    Returns
+    int, number of bytes per pixel for all bands
+    """
+    return len(bands) * max(pixel_type_bytes(types[b]) for b in bands)
+
+def pixel_type_dtype(pixel_type):
+    """
+    function to return numpy dtype name for ee.PixelType dict returned by ee.Image.bandTypes().getInfo()
+    
+    Args
+    pixel_type - dict, pixel type with precision and optional min and max values
+
+    Returns
+    str, numpy dtype name eg. 'uint16' or 'float32'
+    """
+    bits = 8 * pixel_type_bytes(pixel_type)
+    if pixel_type.get('precision') in ('float', 'double'):
+        return 'float{}'.format(bits)
+    return '{}int{}'.format('' if pixel_type.get('min', -1) < 0 else 'u', bits)
+
+def get_pixel_grid(bounds, scale):
+    """
+    function to snap bounding coordinates to pixel grid at specified scale
+    
+    Args
+    bounds - list of [x, y] coordinates of bounding rectangle in output crs
+    scale - output resolution in crs units
+
+    Returns
+    dict, with origin x_min and y_max, width and height in pixels and scale
+    """
+    xs = [c[0] for c in bounds]
+    ys = [c[1] for c in bounds]
+    x_min = math.floor(min(xs) / scale) * scale
+    y_max = math.ceil(max(ys) / scale) * scale
+    width = max(1, int(math.ceil((max(xs) - x_min) / scale)))
+    height = max(1, int(math.ceil((y_max - min(ys)) / scale)))
+    return {'x_min': x_min, 'y_max': y_max, 'width': width, 'height': height, 'scale': scale}
+
+def split_pixel_grid(grid, bytes_per_pixel, max_tile_bytes=max_request_bytes, max_tile_dim=max_request_dim):
+    """
+    function to split pixel grid into tiles under request size limit
+    
+    Args
+    grid - dict, pixel grid returned by get_pixel_grid
+    bytes_per_pixel - number of bytes per pixel for all bands
+    max_tile_bytes - maximum uncompressed bytes per tile default=max_request_bytes
+    max_tile_dim - maximum pixels per tile side default=max_request_dim
+
+    Returns
+    list of dicts, with tile row, col, pixel offsets, size and crs_transform
+    """
+    max_pixels = max(1, max_tile_bytes // bytes_per_pixel)
+    tile_w = min(grid['width'], max_tile_dim, max(1, int(math.sqrt(max_pixels))))
+    tile_h = min(grid['height'], max_tile_dim, max(1, max_pixels // tile_w))
+    scale = grid['scale']
+
+    tiles = []
+    for row, y_off in enumerate(range(0, grid['height'], tile_h)):
+        for col, x_off in enumerate(range(0, grid['width'], tile_w)):
+            tiles.append({
+                'row': row,
+                'col': col,
+                'x_off': x_off,
+                'y_off': y_off,
+                'width': min(tile_w, grid['width'] - x_off),
+                'height': min(tile_h, grid['height'] - y_off),
+                'crs_transform': [scale, 0, grid['x_min'] + x_off * scale,
+                                  0, -scale, grid['y_max'] - y_off * scale]})
+    return tiles
+
+@ee_utils.requires_ee
+def estimate_size(ee_image, region, crs, scale):
+    """
+    function to estimate output size of ee.Image over region from band types and pixel grid in one request
+
+    Args
+    ee_image - ee.Image object
+    region - extent of image
+    crs - output crs
+    scale - output_resolution
+
+    Returns
+    dict, with bands, band types, bytes_per_pixel, pixel grid, width, height, pixels and uncompressed bytes
+    """
+    # get band names, band types and region bounds in output crs in one request
+    info = ee_utils.get_info({
+        'bands': ee_image.bandNames(),
+        'types': ee_image.bandTypes(),
+        'bounds': region_to_geometry(region).bounds(1, ee.Projection(crs)).coordinates().get(0)
+    })
+    pixel_bytes = bytes_per_pixel(info['types'], info['bands'])
+    grid = get_pixel_grid(info['bounds'], scale)
+    pixels = grid['width'] * grid['height']
+    return {'bands': info['bands'], 'types': info['types'], 'bytes_per_pixel': pixel_bytes, 'grid': grid,
+            'width': grid['width'], 'height': grid['height'], 'pixels': pixels, 'bytes': pixels * pixel_bytes}
+
+def download_tile(ee_image, tile, bands, crs, path):
+    """
+    function to download single tile of ee.Image defined by split_pixel_grid
+    
+    Args
+    ee_image - ee.Image object
+    tile - dict, tile returned by split_pixel_grid
+    bands - list of band names
+    crs - output crs
+    path - output filepath
+
+    Returns
+    path of downloaded tile
+    """
+    params = {
+        'bands': bands,
+        'crs': crs,
+        'crs_transform': tile['crs_transform'],
+        'dimensions': '{}x{}'.format(tile['width'], tile['height']),
+        'format': 'GEO_TIFF'
+    }
+    url = rate_utils.call('download_url', ee_image.getDownloadUrl, params)
+    http_utils.download_file(url, path)
+    return path
+
+@ee_utils.requires_ee
+def download_img_tiled(ee_image, folder, name, region, crs, scale, max_workers=8, max_tile_bytes=max_request_bytes,
+                       max_tile_dim=max_request_dim, output_format='GTiff', bands=None, finalize=False,
+                       return_stats=False):
+    """
+    function to download ee.Image as tiles in parallel and mosaic tiles to single image 
+    
+    Args
+    ee_image - ee.Image object
+    folder - local folder name to save image to
+    name - file_name
+    region - extent of image
+    crs - output crs
+    scale - output_resolution
+    max_workers - number of tiles downloaded at the same time default=8
+    max_tile_bytes - maximum uncompressed bytes per tile request default=max_request_bytes
+    max_tile_dim - maximum pixels per tile side default=max_request_dim
+    output_format - 'GTiff' to mosaic tiles to single GeoTIFF or 'VRT' to keep tiles referenced by VRT. Default='GTiff'
+    bands - list of band names downloaded default=None and all bands of ee_image are downloaded
+    finalize - bool, mosaic tiles directly to Cloud-Optimized GeoTIFF with write_cog. Default=False
+    return_stats - bool, also return finalize stats, see finalize_geotiff. Default=False
+
+    Returns
+    image downloaded to local folder specified, or tuple of image and finalize stats if return_stats is True,
+        stats are None if image isn't finalized
+    """
+    from osgeo import gdal
+
+    if output_format not in {'GTiff', 'VRT'}:
+        raise ValueError(output_format + ' is not compatible, must be GTiff or VRT.')
+
+    if bands is not None:
+        ee_image = ee_image.select(list(bands))
+    # get band names, band types and pixel grid in one request
+    estimate = estimate_size(ee_image, region, crs, scale)
+    bands, grid = estimate['bands'], estimate['grid']
+    tiles = split_pixel_grid(grid, estimate['bytes_per_pixel'], max_tile_bytes, max_tile_dim)
+
+    # download tiles to tile folder
+    down_path = os.path.join(folder, name)
+    tile_folder = os.path.splitext(down_path)[0] + '_tiles'
+    os.makedirs(tile_folder, exist_ok=True)
+
+    def fetch(tile):
+        path = os.path.join(tile_folder, 'tile_{:03d}_{:03d}.tif'.format(tile['row'], tile['col']))
+        return download_tile(ee_image, tile, bands, crs, path)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            tile_paths = list(executor.map(fetch, tiles))
+    except Exception as e:
+        print('Error occurred during download.')
+        print(e)
+        return
+
+    # mosaic tiles
+    if output_format == 'VRT':
+        ds = gdal.BuildVRT(down_path, tile_paths)
+        ds = None
+    elif finalize:
+        # band names, compression, tiling and overviews are written in the same pass as the mosaic
+        t0 = time.perf_counter()
+        bytes_before = sum(os.path.getsize(p) for p in tile_paths)
+        vrt = gdal.BuildVRT('', tile_paths)
+        write_cog(vrt, down_path, bands)
+        vrt = None
+        shutil.rmtree(tile_folder)
+        stats = finalize_stats(t0, bytes_before, os.path.getsize(down_path))
+        return (down_path, stats) if return_stats else down_path
+    else:
+        vrt = gdal.BuildVRT('', tile_paths)
+        ds = gdal.Translate(down_path, vrt, format='GTiff',
+                            creationOptions=['TILED=YES', 'COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER'])
+        ds = None
+        vrt = None
+        shutil.rmtree(tile_folder)
+
+    # set band names
+    set_band_names(down_path, bands)
+    return (down_path, None) if return_stats else down_path
+
+def finalize_stats(t0, bytes_before, bytes_after):
+    """
+    function to return stats of finalized image
+
+    Args
+    t0 - time.perf_counter() when finalizing started
+    bytes_before - size of input in bytes
+    bytes_after - size of finalized image in bytes
+
+    Returns
+    dict, with seconds taken, bytes before and after and bytes saved
+    """
+    return {'seconds': time.perf_counter() - t0, 'bytes_before': bytes_before, 'bytes_after': bytes_after,
+            'bytes_saved': bytes_before - bytes_after}
+
+def write_cog(src, dst_path, band_names=None, no_data_val=None, compress='DEFLATE', blocksize=512, overviews=True,
+              threads='ALL_CPUS'):
+    """
+    function to write gdal dataset as Cloud-Optimized GeoTIFF with band names, nodata, compression, internal tiling
+    and overviews in a single pass
+    
+    Args
+    src - gdal dataset
+    dst_path - output filepath
+    band_names - list of band names default=None and band names of src are kept
+    no_data_val - no data value default=None and nodata of src is kept
+    compress - compression default='DEFLATE'
+    blocksize - internal tile size in pixels default=512
+    overviews - bool, build overviews default=True
+    threads - number of threads used for compression and overviews default='ALL_CPUS'
+    """
+    from osgeo import gdal
+
+    # set metadata on in-memory VRT so source file is not opened in update mode
+    vrt = gdal.Translate('', src, format='VRT')
+    for i in range(vrt.RasterCount):
+        band = vrt.GetRasterBand(i + 1)
+        if band_names is not None:
+            band.SetDescription(band_names[i])
+        if no_data_val is not None:
+            band.SetNoDataValue(no_data_val)
+
+    options = ['COMPRESS={}'.format(compress), 'BLOCKSIZE={}'.format(blocksize), 'NUM_THREADS={}'.format(threads),
+               'OVERVIEWS={}'.format('AUTO' if overviews else 'NONE'), 'BIGTIFF=IF_SAFER']
+    if compress in {'DEFLATE', 'LZW', 'ZSTD'}:
+        options.append('PREDICTOR=YES')
+    ds = gdal.Translate(dst_path, vrt, format='COG', creationOptions=options)
+    ds = None
+    vrt = None
+
+def finalize_geotiff(image, band_names=None, no_data_val=None, compress='DEFLATE', blocksize=512, overviews=True,
+                     threads='ALL_CPUS'):
+    """
+    function to write band names and nodata and convert downloaded image to Cloud-Optimized GeoTIFF in a single pass,
+    replaces separate set_band_names and set_nodata_val calls
+    
+    Args
+    image - str, filepath to image
+    band_names - list of band names default=None and band names are kept
+    no_data_val - no data value default=None and nodata is kept
+    compress, blocksize, overviews, threads - passed to write_cog
+
+    Returns
+    dict, with seconds taken, bytes before and after and bytes saved
+    """
+    from osgeo import gdal
+
+    t0 = time.perf_counter()
+    bytes_before = os.path.getsize(image)
+    tmp_path = image + '.cog.tif'
+    src = gdal.Open(image)
+    write_cog(src, tmp_path, band_names, no_data_val, compress, blocksize, overviews, threads)
+    src = None
+    os.replace(tmp_path, image)
+
+    return finalize_stats(t0, bytes_before, os.path.getsize(image))
+
+def pixel_grid_request(tile, crs):
+    """
+    function to return pixel grid of tile in the form used by ee.data.computePixels
+    
+    Args
+    tile - dict, tile returned by split_pixel_grid
+    crs - crs as epsg code eg. 'EPSG:2193' or WKT
+
+    Returns
+    dict, computePixels grid
+    """
+    t = tile['crs_transform']
+    grid = {
+        'dimensions': {'width': tile['width'], 'height': tile['height']},
+        'affineTransform': {'scaleX': t[0], 'shearX': t[1], 'translateX': t[2],
+                            'shearY': t[3], 'scaleY': t[4], 'translateY': t[5]}}
+    if crs.upper().startswith('EPSG:'):
+        grid['crsCode'] = crs.upper()
+    else:
+        grid['crsWkt'] = crs
+    return grid
+
+def decode_npy(data):
+    """
+    function to decode NPY bytes as numpy array without copying data
+    
+    Args
+    data - bytes in NPY format
+
+    Returns
+    read-only numpy array viewing data
+    """
+    import numpy as np
+
+    buffer = io.BytesIO(data)
+    version = np.lib.format.read_magic(buffer)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(buffer)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(buffer)
+    array = np.frombuffer(data, dtype=dtype, count=int(np.prod(shape)), offset=buffer.tell())
+    return array.reshape(shape, order='F' if fortran_order else 'C')
+
+def fetch_pixels(ee_image, tile, bands, crs):
+    """
+    function to fetch pixels of tile with ee.data.computePixels
+    
+    Args
+    ee_image - ee.Image object
+    tile - dict, tile returned by split_pixel_grid
+    bands - list of band names
+    crs - output crs
+
+    Returns
+    numpy structured array with one field per band
+    """
+    data = rate_utils.call('pixels', ee.data.computePixels, {
+        'expression': ee_image,
+        'fileFormat': 'NPY',
+        'bandIds': bands,
+        'grid': pixel_grid_request(tile, crs)})
+    return decode_npy(data)
+
+def to_xarray(array, grid, crs):
+    """
+    function to convert structured array to xarray DataArray with band, y and x coordinates and crs
+    
+    Args
+    array - numpy structured array with one field per band
+    grid - dict, pixel grid returned by get_pixel_grid
+    crs - crs of grid
+
+    Returns
+    xarray.DataArray
+    """
+    import numpy as np
+    import xarray as xr
+    from numpy.lib import recfunctions
+
+    scale = grid['scale']
+    # pixel centre coordinates
+    x = grid['x_min'] + (np.arange(grid['width']) + 0.5) * scale
+    y = grid['y_max'] - (np.arange(grid['height']) + 0.5) * scale
+    bands = list(array.dtype.names)
+    data = np.moveaxis(recfunctions.structured_to_unstructured(array), -1, 0)
+    return xr.DataArray(data, dims=('band', 'y', 'x'), coords={'band': bands, 'y': y, 'x': x},
+                        attrs={'crs': crs, 'transform': [scale, 0, grid['x_min'], 0, -scale, grid['y_max']]})
+
+@ee_utils.requires_ee
+def download_img_array(ee_image, region, crs, scale, as_xarray=False, max_workers=8, max_tile_bytes=max_request_bytes,
+                       max_tile_dim=max_request_dim):
+    """
+    function to fetch pixels of ee.Image into memory without writing a file, tiles are fetched in parallel
+    into one preallocated array
+    
+    Args
+    ee_image - ee.Image object
+    region - extent of image
+    crs - output crs
+    scale - output_resolution
+    as_xarray - bool, return xarray.DataArray with coordinates and crs. Default=False and numpy structured array is
+        returned
+    max_workers - number of tiles fetched at the same time default=8
+    max_tile_bytes - maximum uncompressed bytes per tile request default=max_request_bytes
+    max_tile_dim - maximum pixels per tile side default=max_request_dim
+
+    Returns
+    numpy structured array with one field per band or xarray.DataArray
+    """
+    import numpy as np
+
+    estimate = estimate_size(ee_image, region, crs, scale)
+    bands, grid = estimate['bands'], estimate['grid']
+    tiles = split_pixel_grid(grid, estimate['bytes_per_pixel'], max_tile_bytes, max_tile_dim)
+
+    # fetch first tile to get output dtype and preallocate output
+    first = fetch_pixels(ee_image, tiles[0], bands, crs)
+    out = np.empty((grid['height'], grid['width']), dtype=first.dtype)
+    lock = threading.Lock()
+
+    def fill(tile, array):
+        with lock:
+            out[tile['y_off']:tile['y_off'] + tile['height'], tile['x_off']:tile['x_off'] + tile['width']] = array
+
+    fill(tiles[0], first)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(tile, executor.submit(fetch_pixels, ee_image, tile, bands, crs)) for tile in tiles[1:]]
+        for tile, future in futures:
+            fill(tile, future.result())
+
+    if as_xarray:
+        return to_xarray(out, grid, crs)
+    return out
@@ -1,12 +1,13 @@
 # import modules
 import ee
+import datetime
+import geeutil.ee_utils as ee_utils
+import geeutil.cache_utils as cache_utils
 import geeutil.feature_utils as feature_utils
 import geeutil.image_utils as image_utils
 import geeutil.sentinel2_utils as s2_utils
 import geeutil.landsat_utils as landsat_utils
-
-# Initialize GEE
-ee.Initialize()
+import geeutil.rate_utils as rate_utils
 
 # define global variables
 # define valid sensors
@@ -23,6 +24,7 @@ img_bands = {'S2': ['B2', 'B3', 'B4', 'B5', 'B6', 'B7','B8', 'B8A', 'B11', 'B12'
         'LS8': ['B2', 'B3', 'B4', 'B5', 'B6', 'B7'],
         'HLSL30': ['B2', 'B3', 'B4', 'B5', 'B6', 'B7'],
         'LS8_sr': ['SR_B2', 'SR_B3', 'SR_B4', 'SR_B5', 'SR_B6', 'SR_B7'],
+        'LS9': ['B2', 'B3', 'B4', 'B5', 'B6', 'B7'],
         'LS9_sr': ['SR_B2', 'SR_B3', 'SR_B4', 'SR_B5', 'SR_B6', 'SR_B7'],
         'S1': ['HH', 'HV', 'VV', 'VH', 'angle']}
 
@@ -36,6 +38,20 @@ sensor_id = {'S2': ['COPERNICUS/S2_SR_HARMONIZED', 'COPERNICUS/S2_HARMONIZED'],
         'S1': ['COPERNICUS/S1_GRD'],
         'HLSL30': ['NASA/HLS/HLSL30/v002']} 
 
+# dict containing scene cloud cover property for each sensor
+cloud_cover_property = {'S2': 'CLOUDY_PIXEL_PERCENTAGE', 'HLSL30': 'CLOUD_COVERAGE', 'LS4': 'CLOUD_COVER',
+        'LS5': 'CLOUD_COVER', 'LS7': 'CLOUD_COVER', 'LS8': 'CLOUD_COVER', 'LS9': 'CLOUD_COVER'}
+
+# dict containing tile properties used to filter collections for each sensor, WRS-2 path/row or MGRS tile
+tile_property = {'S2': ['MGRS_TILE'], 'HLSL30': ['MGRS_TILE_ID'], 'LS4': ['WRS_PATH', 'WRS_ROW'],
+        'LS5': ['WRS_PATH', 'WRS_ROW'], 'LS7': ['WRS_PATH', 'WRS_ROW'], 'LS8': ['WRS_PATH', 'WRS_ROW'],
+        'LS9': ['WRS_PATH', 'WRS_ROW']}
+
+# local tile index files and id columns used by tiles_for_roi, eg. USGS WRS-2 descending and ESA Sentinel-2
+# MGRS tiling grid. Index files are not distributed with geeutil, set path to the downloaded file
+tile_index = {'WRS2': {'path': None, 'columns': ['PATH', 'ROW']},
+        'MGRS': {'path': None, 'columns': ['Name']}}
+
 # list of band names
 band_names = ['blue', 'green', 'red', 'RE1', 'RE2', 'RE3', 'NIR', 'RE4', 'SWIR1', 'SWIR2']
 
@@ -63,7 +79,86 @@ def rename_img_bands(sensor):
     return(rename)
 
 
-def gen_imageCollection_from_shp(year, region_shp, sensor):
+@ee_utils.requires_ee
+def roi_footprint(roi, footprint='convex_hull', max_error=100):
+        """
+        function that returns a cheap footprint of roi for filterBounds, the exact roi should still be used for clipping and reductions
+
+        Args
+        roi - ee.Geometry, ee.Feature or ee.FeatureCollection defining region of interest
+        footprint - 'convex_hull', 'bounds' or 'simplify'. Default='convex_hull', None and roi is returned unchanged
+        max_error - error margin in metres default=100
+
+        returns
+        ee.Geometry footprint of roi
+        """
+        if footprint is None:
+                return roi
+        if footprint not in {'convex_hull', 'bounds', 'simplify'}:
+                raise ValueError(footprint + ' is not compatible, must be convex_hull, bounds or simplify.')
+
+        # collect geometries of features without dissolving them
+        geometry = roi if isinstance(roi, ee.Geometry) else ee.FeatureCollection(roi).geometry(max_error)
+        if footprint == 'convex_hull':
+                return geometry.convexHull(max_error)
+        if footprint == 'bounds':
+                return geometry.bounds(max_error)
+        return geometry.simplify(max_error)
+
+@ee_utils.requires_ee
+def tile_filter(sensor, tiles):
+        """
+        function that returns ee.Filter selecting scenes by WRS-2 path/row or MGRS tile
+
+        Args
+        sensor - sensor type as string (S2, LS7, LS8)
+        tiles - list of MGRS tile ids eg. ['59GPM'] for S2 and HLSL30 or (path, row) tuples for Landsat
+
+        returns
+        ee.Filter object
+        """
+        properties = tile_property[sensor]
+        if len(properties) == 1:
+                return ee.Filter.inList(properties[0], list(tiles))
+
+        # group rows by path so filter has one clause per path
+        rows_by_path = {}
+        for path, row in tiles:
+                rows_by_path.setdefault(int(path), []).append(int(row))
+        filters = [ee.Filter.And(ee.Filter.eq(properties[0], path), ee.Filter.inList(properties[1], rows))
+                   for path, rows in sorted(rows_by_path.items())]
+        return filters[0] if len(filters) == 1 else ee.Filter.Or(*filters)
+
+def tiles_for_roi(gdf, sensor, index_path=None):
+        """
+        function that returns tiles intersecting roi from a local WRS-2 or MGRS tile index without any request to earth engine
+
+        Args
+        gdf - geopandas dataframe defining region of interest
+        sensor - sensor type as string (S2, LS7, LS8)
+        index_path - path to tile index file. Default=None and path in tile_index is used
+
+        returns
+        list of MGRS tile ids for S2 and HLSL30 or (path, row) tuples for Landsat
+        """
+        import geopandas as gpd
+
+        index = tile_index['MGRS' if len(tile_property[sensor]) == 1 else 'WRS2']
+        index_path = index_path or index['path']
+        if index_path is None:
+                raise ValueError('No tile index file set for ' + sensor + ', pass index_path or set tile_index path.')
+
+        roi = gdf.to_crs(4326)
+        tiles = gpd.read_file(index_path, bbox=tuple(roi.total_bounds)).to_crs(4326)
+        tiles = tiles[tiles.intersects(roi.unary_union)]
+        columns = index['columns']
+        if len(columns) == 1:
+                return sorted(tiles[columns[0]].unique().tolist())
+        return sorted({(int(p), int(r)) for p, r in zip(tiles[columns[0]], tiles[columns[1]])})
+
+
+@ee_utils.requires_ee
+def gen_imageCollection_from_shp(year, region_shp, sensor, footprint='convex_hull', tile_index_path=None):
     """
     function that returns annual ee.ImageCollection for Landsat or Sentinel surface reflectance and top-of-atmosphere images.  
     
@@ -72,6 +167,9 @@ def gen_imageCollection_from_shp(year, region_shp, sensor):
     sensor - sensor type to build composite image as string (S2, LS7, LS8)
     region_shp - shapefile defining region for composite, accepts polygons and lines, if polyline representing coastline output will be coast
             zone defined as 3km buffer zone around coastline
+    footprint - footprint of region used to filter scenes, see roi_footprint. Default='convex_hull'
+    tile_index_path - path to local WRS-2 or MGRS tile index, if set scenes are also filtered by tiles intersecting region.
+            Default=None
     
     returns
     ee.ImageCollection object for specified sensor, region and year
@@ -96,12 +194,19 @@ def gen_imageCollection_from_shp(year, region_shp, sensor):
 
     # define sr image collection
     collection = ee.ImageCollection(sensor_id[sensor][0]) \
-        .filterBounds(roi) \
+        .filterBounds(roi_footprint(roi, footprint)) \
         .filterDate(start_date, end_date)
+
+    # filter by tiles from local tile index
+    if tile_index_path is not None:
+        import geopandas as gpd
+
+        collection = collection.filter(tile_filter(sensor, tiles_for_roi(gpd.read_file(region_shp), sensor, tile_index_path)))
     
     return collection
 
-def gen_imageCollection(year, roi, sensor, cloud_cover=None, surface_reflectance=True):
+@ee_utils.requires_ee
+def gen_imageCollection(year, roi, sensor, cloud_cover=None, surface_reflectance=True, footprint='convex_hull', tiles=None):
         """
         function that returns annual ee.ImageCollection for Landsat or Sentinel surface reflectance and top-of-atmosphere images.  
 
@@ -110,6 +215,8 @@ def gen_imageCollection(year, roi, sensor, cloud_cover=None, surface_reflectance
         sensor - sensor type to build composite image as string (S2, LS7, LS8)
         roi - ee.featureCollection object defining region of interest
         cloud_cover - integer representing cloud cover % for scenes to be included. Default=None and all scenes are considered. 
+        footprint - footprint of roi used to filter scenes, see roi_footprint. Default='convex_hull'
+        tiles - list of MGRS tiles or WRS-2 (path, row) tuples scenes are selected from, see tiles_for_roi. Default=None
 
         returns
         ee.ImageCollection object for specified sensor, region and year
@@ -129,10 +236,14 @@ def gen_imageCollection(year, roi, sensor, cloud_cover=None, surface_reflectance
 
         #print("Generating composite image for {} for {}".format(sensor, year))
 
-        # define sr image collection
+        # define sr image collection, filter by cheap footprint of roi
+        bounds = roi_footprint(roi, footprint)
         collection = ee.ImageCollection(sensor_id[sensor][0]) \
-        .filterBounds(roi) \
-        .filterDate(start_date, end_date) \
+        .filterBounds(bounds) \
+        .filterDate(start_date, end_date)
+
+        if tiles is not None:
+                collection = collection.filter(tile_filter(sensor, tiles))
         
         # perform sentinel cloudmasking 
         if sensor == 'S2':
@@ -141,17 +252,12 @@ def gen_imageCollection(year, roi, sensor, cloud_cover=None, surface_reflectance
                         collection = collection.filterMetadata('CLOUDY_PIXEL_PERCENTAGE', 'less_than', cloud_cover)
                 
                 # join sentinel cloud probabilty
-                img_collection = s2_utils.join_S2_cld_prob(collection, roi, start_date, end_date)
-
-                # map cloud masking workflow over collection
-                img_collection = (img_collection 
-                        # add is_clouds band
-                        .map(s2_utils.add_cloud_shadow_mask) 
-                        # add cloud_shdw_mask # use default buffer value (50m)
-                        # mask clouds
-                        .map(s2_utils.mask_clouds)
-                        # rename bands
-                        .map(rename_img_bands(sensor)))
+                img_collection = s2_utils.join_S2_cld_prob(collection, bounds, start_date, end_date)
+
+                # map cloud masking, band selection and renaming over collection as one fused function
+                # use default buffer value (50m)
+                img_collection = img_collection.map(s2_utils.cloud_shadow_mask_pipeline(
+                        output_bands=[], apply_mask=True, bands=img_bands[sensor], band_names=band_names))
                 
         elif sensor == 'HLSL30':
                # filter collection by cloud cover if cloud_cover is not none
@@ -181,18 +287,25 @@ def gen_imageCollection(year, roi, sensor, cloud_cover=None, surface_reflectance
 
         return img_collection
 
-def return_least_cloudy_image(year, roi, sensor, cloud_cover=None, return_least_cloudy=True):
+@ee_utils.requires_ee
+def return_least_cloudy_image(year, roi, sensor, cloud_cover=None, return_least_cloudy=True, footprint='convex_hull',
+                              surface_reflectance=True):
         """
-        function that returns annual ee.ImageCollection for Landsat or Sentinel surface reflectance and top-of-atmosphere images.  
+        function that returns Landsat or Sentinel image with lowest scene cloud cover for year, see return_clearest_image
+        to select image by clear pixels inside roi
 
         Args
         year - year as integer eg. 2019
-        sensor - sensor type to build composite image as string (S2, LS7, LS8)
+        sensor - sensor type as string (S2, LS7, LS8)
         roi - ee.featureCollection object defining region of interest
         cloud_cover - integer representing cloud cover % for scenes to be included. Default=None and all scenes are considered. 
+        return_least_cloudy - bool, sort scenes by ascending cloud cover. Default=True
+        footprint - footprint of roi used to prefilter scenes before the exact roi filter, see roi_footprint.
+                Default='convex_hull'
+        surface_reflectance - bool, use surface reflectance collection, top-of-atmosphere if False. Default=True
 
         returns
-        ee.ImageCollection object for specified sensor, region and year
+        ee.Image object with renamed bands
         """
 
         # define date ranges 
@@ -201,24 +314,304 @@ def return_least_cloudy_image(year, roi, sensor, cloud_cover=None, return_least_
 
         # raise error if sensor isn't compatible
         if sensor not in valid_optical_sensors:
-                raise ValueError(sensor + ' is not compatible, must be S2, LS5, LS7 or LS8.')
+                raise ValueError(sensor + ' is not compatible, must be S2, LS4, LS5, LS7 or LS8.')
 
-        #print("Generating composite image for {} for {}".format(sensor, year))
+        # HLS has a single collection, surface reflectance Landsat bands are prefixed with SR_
+        collection_id = sensor_id[sensor][0] if surface_reflectance else sensor_id[sensor][-1]
+        bands = f'{sensor}_sr' if surface_reflectance and sensor not in ('S2', 'HLSL30') else sensor
+
+        collection = ee.ImageCollection(collection_id) \
+        .filterBounds(roi_footprint(roi, footprint)) \
+        .filterDate(start_date, end_date)
+        # footprint is only a cheap prefilter, keep scenes that intersect the exact roi so the returned scene
+        # can't fall inside the footprint but outside a concave roi
+        if footprint is not None:
+                collection = collection.filterBounds(roi)
+        if cloud_cover is not None:
+                collection = collection.filterMetadata(cloud_cover_property[sensor], 'less_than', cloud_cover)
+
+        collection = collection.sort(cloud_cover_property[sensor], return_least_cloudy) \
+        .map(rename_img_bands(bands))
+
+        return ee.Image(collection.first())
+
+def scene_date(time_start):
+        """
+        function that returns acquisition date of scene as 'YYYY-MM-DD'
+
+        Args
+        time_start - system:time_start of scene in milliseconds
+
+        returns
+        str, date of scene
+        """
+        return datetime.datetime.fromtimestamp(time_start / 1000, datetime.timezone.utc).date().isoformat()
+
+def clear_fraction(region, scale=30):
+        """
+        function that returns a single .map() function that sets the fraction of region covered by unmasked pixels of
+        cloud masked image as clear_fraction property
+
+        Args
+        region - ee.Geometry object
+        scale - resolution clear pixels are counted at. Default=30
+
+        returns
+        function to be passed to ee.ImageCollection.map()
+        """
+        def score(image):
+                # pixels outside scene footprint and masked pixels count as not clear, sameFootprint=False so
+                # pixels outside the footprint are filled with 0 instead of staying masked
+                clear = image.select(0).mask().gt(0).unmask(0, False).rename('clear')
+                fraction = clear.reduceRegion(ee.Reducer.mean(), region, scale, maxPixels=1e9).get('clear')
+                # regions without pixels at scale score 0
+                return image.set('clear_fraction', ee.List([fraction, 0]).reduce(ee.Reducer.firstNonNull()))
+        return(score)
+
+@ee_utils.requires_ee
+def rank_scenes(year, roi, sensor, k=5, cloud_cover=None, scale=30, footprint='convex_hull', cache=None):
+        """
+        function that ranks scenes of annual collection built by gen_imageCollection by fraction of roi covered by clear
+        pixels, using the cloud masks of gen_imageCollection. Scores of all scenes are computed in one request and saved
+        to cache per scene and roi so only new scenes are scored again, scenes are listed from the same collection
+
+        Args
+        year - year as integer eg. 2019
+        roi - ee.featureCollection object defining region of interest
+        sensor - sensor type as string (S2, LS7, LS8)
+        k - number of scenes returned. Default=5, None and all scenes are returned
+        cloud_cover - integer representing cloud cover % for scenes to be included. Default=None and all scenes are considered.
+        scale - resolution clear pixels are counted at. Default=30
+        footprint - footprint of roi used to filter scenes, see roi_footprint. Default='convex_hull'
+        cache - cache_utils.MetadataCache object. Default=None and scores are not cached
+
+        returns
+        list of dicts, with scene_id, system:time_start, scene cloud cover and clear_fraction, sorted by clear_fraction
+        """
+        collection = gen_imageCollection(year, roi, sensor, cloud_cover=cloud_cover, footprint=footprint)
+        collection_id = sensor_id[sensor][0]
+        properties = ['system:index', 'system:time_start', cloud_cover_property[sensor]]
+        filters = {'score': 'clear_fraction', 'scale': scale}
 
-        # define sr image collection
-        collection = ee.ImageCollection(sensor_id[sensor][1]) \
+        def scene_key(scene_id, time_start):
+                # scenes are cached by acquisition date so scores of past scenes never expire
+                date = scene_date(time_start)
+                return cache_utils.make_key(collection_id, date, date, roi, dict(filters, scene=scene_id)), date
+
+        # read cached scores, only scenes that aren't cached are scored
+        scores = []
+        if cache is not None:
+                # list scenes of the collection that is scored so footprint, cloud cover and cloud probability join
+                # filters match the scores
+                start_date = str(year) + '-01-01'
+                end_date = f'{year + 2}-01-01' if sensor == 'LS4' else str(year + 1) + '-01-01'
+                scene_filters = {'cloud_cover': cloud_cover, 'footprint': footprint, 'properties': properties}
+                key = cache_utils.make_key(collection_id, start_date, end_date, roi, scene_filters)
+                metadata = cache.get(key)
+                if metadata is None:
+                        rows = collection.reduceColumns(ee.Reducer.toList(len(properties)), properties).get('list')
+                        metadata = [dict(zip(properties, row)) for row in rate_utils.call('info', rows.getInfo)]
+                        cache.set(key, metadata, collection_id, start_date, end_date, roi, scene_filters)
+                missing = []
+                for scene in metadata:
+                        cached = cache.get(scene_key(scene['system:index'], scene['system:time_start'])[0])
+                        if cached is None:
+                                missing.append(scene['system:index'])
+                        else:
+                                scores.append(cached)
+                if missing:
+                        collection = collection.filter(ee.Filter.inList('system:index', missing))
+                else:
+                        collection = None
+
+        if collection is not None:
+                columns = properties + ['clear_fraction']
+                rows = collection.map(clear_fraction(image_utils.region_to_geometry(roi), scale)) \
+                .reduceColumns(ee.Reducer.toList(len(columns)), columns).get('list')
+                rows = rate_utils.call('info', rows.getInfo)
+                for row in rows:
+                        scene = dict(zip(columns, row))
+                        scene['scene_id'] = scene.pop('system:index')
+                        scores.append(scene)
+                        if cache is not None:
+                                key, date = scene_key(scene['scene_id'], scene['system:time_start'])
+                                cache.set(key, scene, collection_id, date, date, roi,
+                                          dict(filters, scene=scene['scene_id']))
+
+        scores.sort(key=lambda scene: (-scene['clear_fraction'], scene['system:time_start']))
+        return scores if k is None else scores[:k]
+
+@ee_utils.requires_ee
+def return_clearest_image(year, roi, sensor, cloud_cover=None, scale=30, footprint='convex_hull', cache=None):
+        """
+        function that returns cloud masked image of annual collection built by gen_imageCollection with the largest
+        fraction of clear pixels inside roi, see rank_scenes
+
+        Args
+        year - year as integer eg. 2019
+        roi - ee.featureCollection object defining region of interest
+        sensor - sensor type as string (S2, LS7, LS8)
+        cloud_cover - integer representing cloud cover % for scenes to be included. Default=None and all scenes are considered.
+        scale - resolution clear pixels are counted at. Default=30
+        footprint - footprint of roi used to filter scenes, see roi_footprint. Default='convex_hull'
+        cache - cache_utils.MetadataCache object. Default=None and scores are not cached
+
+        returns
+        ee.Image object with renamed bands and clear_fraction property
+        """
+        scenes = rank_scenes(year, roi, sensor, 1, cloud_cover, scale, footprint, cache)
+        if not scenes:
+                raise ValueError('No {} scenes found for {}.'.format(sensor, year))
+        best = scenes[0]
+        collection = gen_imageCollection(year, roi, sensor, cloud_cover=cloud_cover, footprint=footprint) \
+        .filter(ee.Filter.eq('system:index', best['scene_id']))
+        return ee.Image(collection.first()).set('clear_fraction', best['clear_fraction'])
+
+@ee_utils.requires_ee
+def get_collection_metadata(year, roi, sensor, cloud_cover=None, surface_reflectance=True, properties=None, cache=None):
+        """
+        function that returns scene metadata of annual collection built by gen_imageCollection in one request,
+        metadata is read from and saved to cache if a cache is given
+
+        Args
+        year - year as integer eg. 2019
+        roi - ee.featureCollection object defining region of interest
+        sensor - sensor type as string (S2, LS7, LS8)
+        cloud_cover - integer representing cloud cover % for scenes to be included. Default=None and all scenes are considered.
+        surface_reflectance - bool, use surface reflectance collection, top-of-atmosphere if False. Default=True
+        properties - list of image properties to return. Default=None and system:index, system:time_start and
+                cloud cover property are returned
+        cache - cache_utils.MetadataCache object. Default=None and metadata is not cached
+
+        returns
+        list of dicts, image properties of each scene in collection
+        """
+        # raise error if sensor isn't compatible
+        if sensor not in valid_optical_sensors:
+                raise ValueError(sensor + ' is not compatible, must be S2, LS4, LS5, LS7 or LS8.')
+
+        # define date ranges 
+        start_date = str(year) + '-01-01'
+        if sensor == 'LS4':
+                end_date = f'{year + 2}-01-01'
+        else:
+                end_date = str(year + 1) + '-01-01'
+
+        collection_id = sensor_id[sensor][0] if surface_reflectance else sensor_id[sensor][-1]
+        properties = properties or ['system:index', 'system:time_start', cloud_cover_property[sensor]]
+        filters = {'cloud_cover': cloud_cover, 'properties': properties}
+
+        # return cached metadata
+        if cache is not None:
+                key = cache_utils.make_key(collection_id, start_date, end_date, roi, filters)
+                metadata = cache.get(key)
+                if metadata is not None:
+                        return metadata
+
+        collection = ee.ImageCollection(collection_id) \
         .filterBounds(roi) \
-        .filterDate(start_date, end_date) \
-        
+        .filterDate(start_date, end_date)
+        if cloud_cover is not None:
+                collection = collection.filterMetadata(cloud_cover_property[sensor], 'less_than', cloud_cover)
+
+        rows = collection.reduceColumns(ee.Reducer.toList(len(properties)), properties).get('list')
+        rows = rate_utils.call('info', rows.getInfo)
+        metadata = [dict(zip(properties, row)) for row in rows]
+
+        if cache is not None:
+                cache.set(key, metadata, collection_id, start_date, end_date, roi, filters)
+        return metadata
+
+def harmonized_band_names(sensors):
+        """
+        function that returns band names shared by all sensors
+
+        Args
+        sensors - list of sensor types as strings (S2, LS7, LS8)
+
+        returns
+        list of band names
+        """
+        if all(sensor == 'S2' for sensor in sensors):
+                return band_names
+        return band_names[:3] + band_names[6:7] + band_names[-2:]
+
+def harmonize_sensor(sensor, names):
+        """
+        function that returns a single .map() function that masks clouds, applies scale factors so bands are reflectance,
+        selects and renames bands and tags image with sensor
+
+        Args
+        sensor - sensor type as string (S2, LS7, LS8)
+        names - list of harmonized band names to keep, see harmonized_band_names
+
+        returns
+        function to be passed to ee.ImageCollection.map()
+        """
         if sensor == 'S2':
-                if cloud_cover is not None: 
-                        collection = collection.filterMetadata('CLOUDY_PIXEL_PERCENTAGE', 'less_than', cloud_cover) \
-                        .sort('CLOUDY_PIXEL_PERCENTAGE', return_least_cloudy) \
-                        .map(rename_img_bands(sensor))
+                mask = s2_utils.cloud_shadow_mask_pipeline(output_bands=[], apply_mask=True)
+                scale = s2_utils.apply_scale_factors
+                bands, sensor_names = img_bands['S2'], band_names
+        elif sensor == 'HLSL30':
+                # HLS bands are already reflectance
+                mask = landsat_utils.mask_clouds_HLS
+                scale = None
+                bands, sensor_names = img_bands['HLSL30'], harmonized_band_names(['HLSL30'])
         else:
-                if cloud_cover is not None: 
-                        collection = collection.filterMetadata('CLOUD_COVER', 'less_than', cloud_cover) \
-                        .sort('CLOUD_COVER', return_least_cloudy) \
-                        .map(rename_img_bands(sensor))
+                mask = landsat_utils.mask_clouds_LS_qa
+                scale = landsat_utils.apply_scale_factors
+                bands, sensor_names = img_bands[f'{sensor}_sr'], harmonized_band_names([sensor])
+
+        # select harmonized bands in the order of names
+        selected = [bands[sensor_names.index(name)] for name in names]
+
+        def harmonize(image):
+                # mask before scaling, Sentinel-2 shadow detection uses unscaled NIR values
+                image = mask(image)
+                if scale is not None:
+                        image = scale(image)
+                return image.select(selected, names).set({'sensor': sensor, 'scene_id': image.get('system:index')})
+        return(harmonize)
+
+@ee_utils.requires_ee
+def gen_harmonized_collection(start_date, end_date, roi, sensors, cloud_cover=None, footprint='convex_hull'):
+        """
+        function that returns one merged, band harmonized and cloud masked ee.ImageCollection for several sensors over an
+        arbitrary date range. Surface reflectance images are scaled to reflectance and tagged with a sensor property,
+        the collection is built as a single expression so time series reductions run as one server computation
+
+        Args
+        start_date - start date as string 'YYYY-MM-DD'
+        end_date - end date as string 'YYYY-MM-DD', end date is exclusive
+        roi - ee.featureCollection object defining region of interest
+        sensors - list of sensor types as strings eg. ['LS5', 'LS7', 'LS8', 'S2']
+        cloud_cover - integer representing cloud cover % for scenes to be included. Default=None and all scenes are considered.
+        footprint - footprint of roi used to filter scenes, see roi_footprint. Default='convex_hull'
+
+        returns
+        ee.ImageCollection object sorted by date with bands from harmonized_band_names
+        """
+        # raise error if sensor isn't compatible
+        if not sensors:
+                raise ValueError('At least one sensor must be given.')
+        for sensor in sensors:
+                if sensor not in valid_optical_sensors:
+                        raise ValueError(sensor + ' is not compatible, must be S2, LS4, LS5, LS7 or LS8.')
+
+        names = harmonized_band_names(sensors)
+        bounds = roi_footprint(roi, footprint)
+
+        merged = None
+        for sensor in sensors:
+                collection = ee.ImageCollection(sensor_id[sensor][0]) \
+                .filterBounds(bounds) \
+                .filterDate(start_date, end_date)
+                if cloud_cover is not None:
+                        collection = collection.filterMetadata(cloud_cover_property[sensor], 'less_than', cloud_cover)
+                if sensor == 'S2':
+                        collection = s2_utils.join_S2_cld_prob(collection, bounds, start_date, end_date)
+
+                collection = collection.map(harmonize_sensor(sensor, names))
+                merged = collection if merged is None else merged.merge(collection)
 
-        return ee.Image(collection.first())
\ No newline at end of file
+        return merged.sort('system:time_start')
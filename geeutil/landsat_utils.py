@@ -1,8 +1,11 @@
-# import modules
-import ee
-
-# authenticate ee
-ee.Initialize()
+# define global variables
+# QA_PIXEL bits masked by mask_clouds_LS_qa
+ls_qa_bits = {'dilated_cloud': 1, 'cloud': 3, 'shadow': 4}
+# Fmask bits masked by mask_clouds_HLS
+hls_fmask_bits = {'cloud': 1, 'adjacent_cloud': 2, 'shadow': 3}
+# collection 2 surface reflectance and surface temperature scale factors as (multiply, add)
+sr_scale_factors = (0.0000275, -0.2)
+st_scale_factors = (0.00341802, 149.0)
 
 def mask_clouds_LS_qa(image):
     """
@@ -15,9 +18,9 @@ def mask_clouds_LS_qa(image):
     landsat ee.image object with cloud masked
     """
     # define bit_masks
-    shadow_bit_mask = (1 << 4)
-    cloud_bit_mask = (1 << 3)
-    dcloudBitMask = (1 << 1)
+    shadow_bit_mask = (1 << ls_qa_bits['shadow'])
+    cloud_bit_mask = (1 << ls_qa_bits['cloud'])
+    dcloudBitMask = (1 << ls_qa_bits['dilated_cloud'])
     # get qa image band
     qa = image.select('QA_PIXEL')
 
@@ -34,8 +37,8 @@ def apply_scale_factors(image):
     function to apply scale factors to landsat SR collection 2 image
     """
 
-    opticalBands = image.select('SR_B.').multiply(0.0000275).add(-0.2)
-    thermalBands = image.select('ST_B.*').multiply(0.00341802).add(149.0)
+    opticalBands = image.select('SR_B.').multiply(sr_scale_factors[0]).add(sr_scale_factors[1])
+    thermalBands = image.select('ST_B.*').multiply(st_scale_factors[0]).add(st_scale_factors[1])
 
     return image.addBands(opticalBands, None, True) \
               .addBands(thermalBands, None, True)
@@ -51,9 +54,9 @@ def mask_clouds_HLS(image):
     landsat ee.image object with cloud masked
     """
     # define bit_masks
-    shadow_bit_mask = (1 << 3)
-    cloud_bit_mask = (1 << 1)
-    dcloudBitMask = (1 << 2)
+    shadow_bit_mask = (1 << hls_fmask_bits['shadow'])
+    cloud_bit_mask = (1 << hls_fmask_bits['cloud'])
+    dcloudBitMask = (1 << hls_fmask_bits['adjacent_cloud'])
     # get qa image band
     qa = image.select('Fmask')
 
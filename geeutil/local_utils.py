@@ -0,0 +1,205 @@
+# import modules
+import re
+import numpy as np
+import geeutil.landsat_utils as landsat_utils
+import geeutil.sentinel2_utils as s2_utils
+import geeutil.normalised_difference as nd
+
+
+# define global variables
+# functions available to index expressions, matching ee.Image.expression functions
+expression_functions = {'abs': np.abs, 'sqrt': np.sqrt, 'exp': np.exp, 'log': np.log, 'log10': np.log10,
+                        'sin': np.sin, 'cos': np.cos, 'tan': np.tan, 'min': np.minimum, 'max': np.maximum,
+                        'pow': np.power}
+
+
+def read_raster(path, memmap=False):
+    """
+    function to read raster bands as numpy arrays named by band description, as set by image_utils.set_band_names
+
+    Args
+    path - filepath of raster
+    memmap - bool, memory-map bands instead of reading them, only possible for uncompressed rasters. Default=False
+
+    Returns
+    tuple, dict of band name and numpy array and dict with geotransform, projection, nodata and dataset.
+        Memory-mapped arrays are only valid while dataset is referenced
+    """
+    from osgeo import gdal
+
+    ds = gdal.Open(path)
+    bands = {}
+    nodata = {}
+    for i in range(ds.RasterCount):
+        band = ds.GetRasterBand(i + 1)
+        name = band.GetDescription() or 'band_{}'.format(i + 1)
+        bands[name] = band.GetVirtualMemAutoArray() if memmap else band.ReadAsArray()
+        nodata[name] = band.GetNoDataValue()
+    meta = {'geotransform': ds.GetGeoTransform(), 'projection': ds.GetProjection(), 'nodata': nodata, 'dataset': ds}
+    return bands, meta
+
+def bitmask_clear(qa, bits):
+    """
+    function to return pixels where none of the bits are set, as bitwiseAnd(1 << bit).eq(0) for each bit
+
+    Args
+    qa - numpy array of QA band
+    bits - list of bit positions
+
+    Returns
+    boolean numpy array, True for clear pixels
+    """
+    flags = 0
+    for bit in bits:
+        flags |= 1 << bit
+    return (qa.astype(np.int64) & flags) == 0
+
+def apply_mask(bands, clear, exclude=()):
+    """
+    function to mask bands, masked pixels are set to nan as with ee.Image.updateMask
+
+    Args
+    bands - dict of band name and numpy array
+    clear - boolean numpy array, True for valid pixels
+    exclude - list of bands that are returned unmasked eg. QA bands
+
+    Returns
+    dict of band name and float32 numpy array
+    """
+    masked = {}
+    for name, array in bands.items():
+        if name in exclude:
+            masked[name] = array
+            continue
+        out = array.astype(np.float32, copy=True)
+        out[~clear] = np.nan
+        masked[name] = out
+    return masked
+
+def mask_clouds_LS_qa(bands):
+    """
+    function to mask Landsat bands using QA_PIXEL band, local version of landsat_utils.mask_clouds_LS_qa
+
+    Args
+    bands - dict of band name and numpy array including QA_PIXEL
+
+    Returns
+    dict of band name and numpy array with clouds set to nan
+    """
+    clear = bitmask_clear(bands['QA_PIXEL'], landsat_utils.ls_qa_bits.values())
+    return apply_mask(bands, clear, exclude=['QA_PIXEL'])
+
+def mask_clouds_HLS(bands):
+    """
+    function to mask harmonised landsat bands using Fmask band, local version of landsat_utils.mask_clouds_HLS
+
+    Args
+    bands - dict of band name and numpy array including Fmask
+
+    Returns
+    dict of band name and numpy array with clouds set to nan
+    """
+    clear = bitmask_clear(bands['Fmask'], landsat_utils.hls_fmask_bits.values())
+    return apply_mask(bands, clear, exclude=['Fmask'])
+
+def mask_clouds_S2_QA60(bands):
+    """
+    function to mask Sentinel-2 bands using QA60 band, local version of sentinel2_utils.mask_clouds_S2_QA60
+
+    Args
+    bands - dict of band name and numpy array including QA60
+
+    Returns
+    dict of band name and numpy array with clouds set to nan
+    """
+    clear = bitmask_clear(bands['QA60'], s2_utils.qa60_bits.values())
+    return apply_mask(bands, clear, exclude=['QA60'])
+
+def apply_scale_factors_LS(bands):
+    """
+    function to apply collection 2 scale factors to SR_B and ST_B bands, local version of
+    landsat_utils.apply_scale_factors
+
+    Args
+    bands - dict of band name and numpy array
+
+    Returns
+    dict of band name and numpy array
+    """
+    scaled = dict(bands)
+    for name, array in bands.items():
+        if re.fullmatch('SR_B.', name):
+            scaled[name] = array * landsat_utils.sr_scale_factors[0] + landsat_utils.sr_scale_factors[1]
+        elif re.match('ST_B', name):
+            scaled[name] = array * landsat_utils.st_scale_factors[0] + landsat_utils.st_scale_factors[1]
+    return scaled
+
+def apply_scale_factors_S2(bands):
+    """
+    function to apply scale factor to Sentinel-2 optical bands, local version of sentinel2_utils.apply_scale_factors
+
+    Args
+    bands - dict of band name and numpy array
+
+    Returns
+    dict of band name and numpy array
+    """
+    return {name: array * s2_utils.sr_scale_factor if re.match('B', name) else array
+            for name, array in bands.items()}
+
+def normalised_difference(a, b):
+    """
+    function to calculate normalised difference (a - b) / (a + b) as ee.Image.normalizedDifference, pixels where a or b
+    is negative are nan as ee masks them, pixels where a + b is 0 are nan
+
+    Args
+    a, b - numpy arrays
+
+    Returns
+    float32 numpy array
+    """
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where((a < 0) | (b < 0), np.float32(np.nan), (a - b) / (a + b))
+
+def compute_index(bands, name):
+    """
+    function to calculate spectral index in normalised_difference.indices from numpy arrays
+
+    Args
+    bands - dict of harmonized band name and numpy array
+    name - index name
+
+    Returns
+    float32 numpy array
+    """
+    index = nd.indices[name]
+    if 'bands' in index:
+        return normalised_difference(bands[index['bands'][0]], bands[index['bands'][1]])
+
+    # evaluate expression with band variables and b('band') as in ee.Image.expression
+    arrays = {v: np.asarray(bands[v], dtype=np.float32) for v in nd.expression_variables(index['expression'])}
+    namespace = dict(expression_functions, **arrays)
+    namespace['b'] = lambda band: np.asarray(bands[band], dtype=np.float32)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.asarray(eval(index['expression'], {'__builtins__': {}}, namespace), dtype=np.float32)
+
+def compute_indices(bands, names):
+    """
+    function to calculate several spectral indices and add them to bands, local version of normalised_difference.add_indices
+
+    Args
+    bands - dict of harmonized band name and numpy array
+    names - list of index names
+
+    Returns
+    dict of band name and numpy array including index bands
+    """
+    unknown = [n for n in names if n not in nd.indices]
+    if unknown:
+        raise ValueError('{} are not registered indices, must be in {}.'.format(unknown, sorted(nd.indices)))
+    out = dict(bands)
+    for name in names:
+        out[name] = compute_index(bands, name)
+    return out
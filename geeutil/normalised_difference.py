@@ -1,78 +1,142 @@
 # import modules
 import ee
+import re
 
-# Initialize GEE
-ee.Initialize()
+# define global variables
+# registry of spectral indices over harmonized band names, normalised difference indices are defined by
+# band pair (a - b) / (a + b), other indices by expression. Add indices with register_index
+indices = {
+    'ndvi': {'bands': ['NIR', 'red']},
+    'ndwi': {'bands': ['green', 'NIR']},
+    'mndwi': {'bands': ['green', 'SWIR1']},
+    'ndmi': {'bands': ['NIR', 'SWIR1']},
+    'awei': {'expression': "4*(b('green')-b('SWIR1'))-(0.25*b('NIR')+2.75*b('SWIR2'))"},
+}
+
+
+def register_index(name, bands=None, expression=None):
+    """function to add spectral index to registry
+
+    Args
+    name - index name, used as output band name
+    bands - list of two band names for normalised difference index (a - b) / (a + b)
+    expression - formula over band names eg. '2.5 * (NIR - red) / (NIR + 6 * red - 7.5 * blue + 1)',
+        bands can be used as variables or with b('band')
+    """
+    if (bands is None) == (expression is None):
+        raise ValueError('Index must be defined by bands or expression.')
+    if bands is not None and len(bands) != 2:
+        raise ValueError('Normalised difference index must be defined by two bands.')
+    indices[name] = {'bands': list(bands)} if bands is not None else {'expression': expression}
+
+def expression_variables(expression):
+    """function to return band names used as variables in index expression
+
+    Args
+    expression - index formula
+
+    returns
+    list of variable names
+    """
+    # names followed by ( are functions and names in quotes are b('band') arguments
+    stripped = re.sub(r"'[^']*'|\"[^\"]*\"", '', expression)
+    names = re.findall(r'\b([A-Za-z_][A-Za-z0-9_]*)\b(?!\s*\()', stripped)
+    return sorted(set(names))
+
+def index_bands(image, names):
+    """function to calculate spectral indices for ee.image object
+
+    Args
+    image - ee.image object with harmonized band names
+    names - list of index names in registry
+
+    returns
+    ee.image object with one band per index
+    """
+    unknown = [n for n in names if n not in indices]
+    if unknown:
+        raise ValueError('{} are not registered indices, must be in {}.'.format(unknown, sorted(indices)))
+
+    bands = []
+    for name in names:
+        index = indices[name]
+        if 'bands' in index:
+            calc = image.normalizedDifference(index['bands'])
+        else:
+            variables = {v: image.select(v) for v in expression_variables(index['expression'])}
+            calc = image.expression(index['expression'], variables)
+        bands.append(calc.select([0], [name]))
+    return ee.Image.cat(bands)
+
+def add_indices(names):
+    """function to build a single .map() function that adds several spectral indices to ee.image object
+    with one addBands call
+
+    Args
+    names - list of index names in registry eg. ['ndvi', 'ndwi', 'mndwi']
+
+    returns
+    function to be passed to ee.ImageCollection.map()
+    """
+    names = list(names)
+
+    def apply(image):
+        return image.addBands(index_bands(image, names))
+    return(apply)
 
 def apply_ndvi(image):
     """function to calculate ndvi for ee.image object and add band to object
-    
-    Args 
+
+    Args
     image - ee.image object
 
     returns
     ee.image object with ndvi  band
     """
-    calc_ndvi = image.normalizedDifference(['NIR', 'red'])
-    ndvi = calc_ndvi.select([0], ['ndvi'])
-    
-    return ee.Image.cat([image, ndvi])
+    return add_indices(['ndvi'])(image)
 
 
 def apply_ndwi(image):
     """function to calculate ndwi for ee.image object and add band to object
-    
-    Args 
+
+    Args
     image - ee.image object
 
     returns
     ee.image object with ndwi  band
     """
-    calc_ndwi = image.normalizedDifference(['green', 'NIR'])
-    ndwi = calc_ndwi.select([0], ['ndwi'])
-    
-    return ee.Image.cat([image, ndwi])
+    return add_indices(['ndwi'])(image)
 
 def apply_mndwi(image):
     """function to calculate mndwi for ee.image object and add band to object
-    
-    Args 
+
+    Args
     image - ee.image object
 
     returns
     ee.image object with mndwi  band
     """
-    calc_mndwi = image.normalizedDifference(['green', 'SWIR1'])
-    mndwi = calc_mndwi.select([0], ['mndwi'])
-    
-    return ee.Image.cat([image, mndwi])
+    return add_indices(['mndwi'])(image)
 
 def apply_ndmi(image):
     """function to calculate ndmi for ee.image object and add band to object
-    
-    Args 
+
+    Args
     image - ee.image object
 
     returns
     ee.image object with mndwi  band
     """
-    calc_ndmi = image.normalizedDifference(['NIR', 'SWIR1'])
-    ndmi = calc_ndmi.select([0], ['ndmi'])
-    
-    return ee.Image.cat([image, ndmi])
+    return add_indices(['ndmi'])(image)
 
 
 def apply_awei(image):
     """function to calculate ndwi for ee.image object and add band to object
-    
-    Args 
+
+    Args
     image - ee.image object
 
     returns
     ee.image object with ndwi  band
     """
-    calc_awei = image.expression("4*(b('green')-b('SWIR1'))-(0.25*b('NIR')+2.75*b('SWIR2'))")
-    awei = calc_awei.select([0], ['awei'])
-    
-    return ee.Image.cat([image, awei])
-
+    return add_indices(['awei'])(image)
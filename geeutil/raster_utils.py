@@ -0,0 +1,164 @@
+# import modules
+import os
+import functools
+import numpy as np
+from multiprocessing import Pool
+import geeutil.local_utils as local_utils
+
+
+# define global variables
+# creation options of tiled, compressed pipeline output
+default_creation_options = ['TILED=YES', 'BLOCKXSIZE=512', 'BLOCKYSIZE=512', 'COMPRESS=DEFLATE', 'PREDICTOR=2',
+                            'BIGTIFF=IF_SAFER', 'NUM_THREADS=ALL_CPUS']
+
+# dataset opened once in each worker process by _init_worker
+_worker = {}
+
+
+def raster_windows(width, height, block_x, block_y, window_size=None):
+    """
+    function to split raster into windows aligned with native GDAL blocks
+
+    Args
+    width, height - raster size in pixels
+    block_x, block_y - native block size in pixels
+    window_size - approximate window side in pixels, rounded to whole blocks. Default=None and one block per window,
+        strip blocks are grouped so windows have at least 256 rows
+
+    Returns
+    list of tuples, (x_off, y_off, x_size, y_size)
+    """
+    if window_size is None:
+        win_x, win_y = block_x, block_y if block_y >= 256 else block_y * int(np.ceil(256 / block_y))
+    else:
+        win_x = max(1, int(round(window_size / block_x))) * block_x
+        win_y = max(1, int(round(window_size / block_y))) * block_y
+    win_x = min(win_x, width)
+    return [(x, y, min(win_x, width - x), min(win_y, height - y))
+            for y in range(0, height, win_y) for x in range(0, width, win_x)]
+
+def read_window(ds, window, mask_nodata=True):
+    """
+    function to read raster window as dict of band name and numpy array
+
+    Args
+    ds - gdal dataset
+    window - tuple, (x_off, y_off, x_size, y_size)
+    mask_nodata - bool, set nodata pixels to nan default=True
+
+    Returns
+    dict of band name and numpy array
+    """
+    bands = {}
+    for i in range(ds.RasterCount):
+        band = ds.GetRasterBand(i + 1)
+        name = band.GetDescription() or 'band_{}'.format(i + 1)
+        array = band.ReadAsArray(*window)
+        nodata = band.GetNoDataValue()
+        if mask_nodata and nodata is not None:
+            array = array.astype(np.float32)
+            array[array == nodata] = np.nan
+        bands[name] = array
+    return bands
+
+def _init_worker(src_path):
+    from osgeo import gdal
+
+    _worker['ds'] = gdal.Open(src_path)
+
+def _process_window(window, operations, mask_nodata):
+    bands = read_window(_worker['ds'], window, mask_nodata)
+    for operation in operations:
+        bands = operation(bands)
+    return window, bands
+
+def select_bands(bands, names):
+    """
+    function to keep bands in order of names, use as pipeline operation with functools.partial or select_op
+
+    Args
+    bands - dict of band name and numpy array
+    names - list of band names
+
+    Returns
+    dict of band name and numpy array
+    """
+    return {name: bands[name] for name in names}
+
+def select_op(names):
+    """
+    function to return pipeline operation keeping bands listed in names
+    """
+    return functools.partial(select_bands, names=list(names))
+
+def indices_op(names):
+    """
+    function to return pipeline operation adding spectral indices with local_utils.compute_indices
+    """
+    return functools.partial(local_utils.compute_indices, names=list(names))
+
+def process_raster(src_path, dst_path, operations, window_size=None, processes=None, mask_nodata=True,
+                   nodata=-9999, dtype='Float32', creation_options=None):
+    """
+    function to stream raster through a chain of per-pixel operations in native block windows across a process pool
+    and write result to tiled, compressed GeoTIFF. Only a bounded number of windows are held in memory at once
+
+    Args
+    src_path - filepath of input raster
+    dst_path - filepath of output GeoTIFF
+    operations - list of functions taking and returning dict of band name and numpy array, functions must be picklable
+        eg. local_utils.mask_clouds_LS_qa, local_utils.apply_scale_factors_LS, indices_op(['ndvi']), select_op(bands)
+    window_size - approximate window side in pixels default=None and native blocks are used
+    processes - number of worker processes default=None and all cpus are used, 1 processes in the calling process
+    mask_nodata - bool, set input nodata pixels to nan before operations default=True
+    nodata - nodata value written for nan pixels default=-9999
+    dtype - GDAL data type name of output default='Float32'
+    creation_options - list of GeoTIFF creation options default=None and default_creation_options are used
+
+    Returns
+    list of output band names
+    """
+    from osgeo import gdal
+
+    src = gdal.Open(src_path)
+    block_x, block_y = src.GetRasterBand(1).GetBlockSize()
+    windows = raster_windows(src.RasterXSize, src.RasterYSize, block_x, block_y, window_size)
+    processes = processes or os.cpu_count()
+
+    # process first window in calling process to get output bands
+    _worker['ds'] = src
+    first = _process_window(windows[0], operations, mask_nodata)
+    names = list(first[1])
+
+    driver = gdal.GetDriverByName('GTiff')
+    dst = driver.Create(dst_path, src.RasterXSize, src.RasterYSize, len(names), gdal.GetDataTypeByName(dtype),
+                        creation_options or default_creation_options)
+    dst.SetGeoTransform(src.GetGeoTransform())
+    dst.SetProjection(src.GetProjection())
+    for i, name in enumerate(names):
+        band = dst.GetRasterBand(i + 1)
+        band.SetDescription(name)
+        band.SetNoDataValue(nodata)
+
+    def write(result):
+        (x_off, y_off, _, _), bands = result
+        for i, name in enumerate(names):
+            array = np.where(np.isnan(bands[name]), nodata, bands[name]) if bands[name].dtype.kind == 'f' else bands[name]
+            dst.GetRasterBand(i + 1).WriteArray(array, x_off, y_off)
+
+    write(first)
+    worker = functools.partial(_process_window, operations=operations, mask_nodata=mask_nodata)
+    if processes == 1:
+        for window in windows[1:]:
+            write(worker(window))
+    else:
+        # submit windows in batches so memory use is bounded by batch size
+        batch_size = processes * 4
+        with Pool(processes, initializer=_init_worker, initargs=(src_path,)) as pool:
+            for start in range(1, len(windows), batch_size):
+                for result in pool.imap_unordered(worker, windows[start:start + batch_size]):
+                    write(result)
+    _worker.clear()
+    dst.FlushCache()
+    dst = None
+    return names
@@ -0,0 +1,171 @@
+# import modules
+import time
+import random
+import threading
+
+
+# define global variables
+# calls per second allowed in this process for each kind of earth engine call, set with configure
+limits = {'info': 10, 'download_url': 10, 'pixels': 10, 'http': 20, 'task_start': 2, 'task_status': 1}
+# retry policy for transient errors, delays grow exponentially from base_delay up to max_delay with full jitter
+max_retries = 5
+base_delay = 1
+max_delay = 64
+# fragments of error messages caused by rate limits or transient server and connection errors, quota errors are
+# not retried as they don't clear within the retry window
+retryable_errors = ('429', 'too many requests', 'too many concurrent', 'rate limit', 'service unavailable', 'http 5',
+                    'internal error', 'backend error', 'deadline exceeded', 'connection')
+
+_buckets = {}
+_counters = {}
+_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    thread-safe token bucket that allows rate calls per second with bursts of up to capacity calls
+
+    Args
+    rate - tokens added per second
+    capacity - maximum number of tokens default=None and rate is used
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        function to take one token, waiting until it is available
+
+        Returns
+        float, seconds waited
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # reserve token so waiting threads are served in order
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+def configure(rates=None, retries=None, delay=None, delay_limit=None):
+    """
+    function to set rate limits and retry policy of this process, limiters are rebuilt on next call
+
+    Args
+    rates - dict of call kind and calls per second eg. {'info': 5, 'http': 40}
+    retries - number of times calls failing with transient errors are retried
+    delay - seconds before first retry
+    delay_limit - maximum seconds between retries
+    """
+    global max_retries, base_delay, max_delay
+    with _lock:
+        if rates:
+            limits.update(rates)
+            _buckets.clear()
+        if retries is not None:
+            max_retries = retries
+        if delay is not None:
+            base_delay = delay
+        if delay_limit is not None:
+            max_delay = delay_limit
+
+def get_bucket(kind):
+    """
+    function to return shared TokenBucket for kind of call
+    """
+    with _lock:
+        if kind not in _buckets:
+            _buckets[kind] = TokenBucket(limits[kind])
+        return _buckets[kind]
+
+def count(kind, counter):
+    """
+    function to add one to counter of kind, counter is calls, throttled, retried or failed
+    """
+    with _lock:
+        counts = _counters.setdefault(kind, {'calls': 0, 'throttled': 0, 'retried': 0, 'failed': 0})
+        counts[counter] += 1
+
+def stats():
+    """
+    function to return counters of calls, throttled calls, retried calls and failed calls for each kind of call
+
+    Returns
+    dict, kind and dict of counters
+    """
+    with _lock:
+        return {kind: dict(counts) for kind, counts in _counters.items()}
+
+def reset_stats():
+    """
+    function to reset counters returned by stats
+    """
+    with _lock:
+        _counters.clear()
+
+def is_retryable(error):
+    """
+    function to return True if error was caused by rate limit or transient server or connection error
+    """
+    message = str(error).lower()
+    return any(fragment in message for fragment in retryable_errors)
+
+def backoff_delay(attempt):
+    """
+    function to return jittered delay before retry attempt
+
+    Args
+    attempt - retry number starting at 0
+
+    Returns
+    float, seconds
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+def throttle(kind):
+    """
+    function to wait for rate limiter of kind without retrying, for callers that handle retries themselves
+
+    Returns
+    float, seconds waited
+    """
+    waited = get_bucket(kind).acquire()
+    count(kind, 'calls')
+    if waited > 0:
+        count(kind, 'throttled')
+    return waited
+
+def call(kind, function, *args, **kwargs):
+    """
+    function to call function under rate limit of kind, calls failing with transient errors are retried
+    with jittered exponential backoff
+
+    Args
+    kind - kind of call in limits eg. 'info', 'download_url', 'pixels', 'http', 'task_start' or 'task_status'
+    function - function to call
+    args, kwargs - arguments passed to function
+
+    Returns
+    return value of function
+    """
+    attempt = 0
+    while True:
+        throttle(kind)
+        try:
+            return function(*args, **kwargs)
+        except Exception as error:
+            if attempt >= max_retries or not is_retryable(error):
+                count(kind, 'failed')
+                raise
+            count(kind, 'retried')
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
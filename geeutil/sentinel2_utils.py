@@ -1,8 +1,15 @@
 # import modules
 import ee 
+import geeutil.ee_utils as ee_utils
+
+# define global variables
+# bands added by cloud_shadow_mask_pipeline
+cloud_shadow_bands = ['probability', 'clouds', 'dark_pixels', 'cloud_transform', 'shadows', 'cloudmask']
+# QA60 bits masked by mask_clouds_S2_QA60
+qa60_bits = {'cloud': 10, 'cirrus': 11}
+# scale factor of Sentinel-2 optical bands
+sr_scale_factor = 0.0001
 
-# authenticate ee
-ee.Initialize()
 
 def mask_clouds_S2_QA60(image):
     """function to mask Sentinel-2 ee.Image object using QA60 band
@@ -16,8 +23,8 @@ def mask_clouds_S2_QA60(image):
 
     qa = image.select('QA60')
     # Bits 10 and 11 are clouds and cirrus, respectively.
-    cloudBitMask = 1 << 10
-    cirrusBitMask = 1 << 11
+    cloudBitMask = 1 << qa60_bits['cloud']
+    cirrusBitMask = 1 << qa60_bits['cirrus']
     # clear if both flags set to zero.
     mask = qa.bitwiseAnd(cloudBitMask).eq(0) \
         .And(qa.bitwiseAnd(cirrusBitMask).eq(0))
@@ -37,77 +44,61 @@ def mask_clouds_S2_probablity(probabilty_val):
         return image.updateMask(isNotCloud)
     return(apply_mask)
 
-def add_cloud_bands_to_img(image):
-    # define cloud probabilty threshold - values > threshold considered cloud
-    cloud_threshold=60
-    # get corresponding s2 cloud probability image for input image
-    cld_prb_path = 'COPERNICUS/S2_CLOUD_PROBABILITY/{}'.format(image.id().getInfo())
-    
-    cld_prb = ee.Image(cld_prb_path)
-
-    # Condition s2cloudless by the probability threshold value.
-    is_cloud = cld_prb.gt(cloud_threshold).rename('clouds')
-
-    # Add the cloud probability layer and cloud mask as image bands.
-    return image.addBands(ee.Image([cld_prb, is_cloud]))
-
-def add_cloud_bands_to_img_collection(image):
+def apply_scale_factors(image):
     """
-    function to add cloud bands to images in ee.ImageCollection as a .map() function
-    args 
-    cloud_prob_treshold - probability that pixel is cloudy if greater than treshold value default=60
-
-    returns
-    ee.ImageCollection with cloud band
+    function to apply scale factor to Sentinel-2 optical bands so values are reflectance
     """
-    cloud_prob_threshold=60
-    # function to add cloud_band to images in ee.ImageCollection
-    
-    # get cloud prob from cloud_mask img
-    cld_prb = ee.Image(image.get('cloud_mask')).select('probability')
+    opticalBands = image.select('B.*').multiply(sr_scale_factor)
 
-    # Condition s2cloudless by the probability threshold value.
-    is_cloud = cld_prb.gt(cloud_prob_threshold).rename('clouds')
+    return image.addBands(opticalBands, None, True)
 
-    # Add the cloud probability layer and cloud mask as image bands.
-    return image.addBands(ee.Image([cld_prb, is_cloud]))
+def get_cloud_probability_img(image):
+    """
+    function to return S2 cloud probability ee.Image for Sentinel-2 ee.Image using a server-side filter,
+    can be used inside .map() function
 
+    args
+    image - Sentinel-2 ee.Image object
 
-def add_shadow_bands_to_img_collection(nir_drk_thresh=0.15):
+    returns
+    ee.Image S2 cloud probability image with matching system:index
     """
-    function to add shadow bands to images in ee.ImageCollection as a .map() function
-    args 
-    nir_drk_thresh - NIR threshold which is considered cloud 
+    date = image.date()
+    return ee.Image(ee.ImageCollection('COPERNICUS/S2_CLOUD_PROBABILITY')
+                    .filterDate(date, date.advance(1, 'day'))
+                    .filter(ee.Filter.eq('system:index', image.get('system:index')))
+                    .first())
 
-    returns
-    ee.ImageCollection with shadow bands
+def cloud_bands(cld_prb, cloud_prob_threshold=60):
     """
-    # define map function
-    def add_shadow_bands(image):
-        # Identify dark NIR pixels that are not water (potential cloud shadow pixels).
-        SR_BAND_SCALE = 1e4
-        dark_pixels = image.select('B8').lt(nir_drk_thresh*SR_BAND_SCALE).rename('dark_pixels')
+    function to return cloud probability and cloud band from S2 cloud probability image
 
-        # Determine the direction to project cloud shadow from clouds (assumes UTM projection).
-        shadow_azimuth = ee.Number(90).subtract(ee.Number(image.get('MEAN_SOLAR_AZIMUTH_ANGLE')))
+    args
+    cld_prb - S2 cloud probability ee.Image
+    cloud_prob_threshold - probability that pixel is cloudy if greater than threshold value default=60
 
-        # Project shadows from clouds for the distance specified by the CLD_PRJ_DIST input.
-        cld_proj = (image.select('clouds').directionalDistanceTransform(shadow_azimuth, 1*10)
-            .reproject(**{'crs': image.select(0).projection(), 'scale': 100}) 
-            .select('distance') 
-            .mask()
-            .rename('cloud_transform'))
+    returns
+    ee.Image probability and clouds bands
+    """
+    cld_prb = cld_prb.select('probability')
+    # Condition s2cloudless by the probability threshold value.
+    is_cloud = cld_prb.gt(cloud_prob_threshold).rename('clouds')
+    return ee.Image([cld_prb, is_cloud])
 
-        # Identify the intersection of dark pixels with cloud shadow projection.
-        shadows = cld_proj.multiply(dark_pixels).rename('shadows')
+def shadow_bands(image, is_cloud, nir_drk_thresh=0.15, cld_prj_dist=1, proj_scale=100):
+    """
+    function to return shadow bands for Sentinel-2 image from cloud band
 
-        # Add dark pixels, cloud projection, and identified shadows as image bands.
-        return image.addBands(ee.Image([dark_pixels, cld_proj, shadows]))
-    return(add_shadow_bands)
+    args
+    image - Sentinel-2 ee.Image object
+    is_cloud - ee.Image cloud band, cloud = 1
+    nir_drk_thresh - NIR reflectance below which pixels are considered potential shadow default=0.15
+    cld_prj_dist - maximum distance in km shadows are projected from clouds default=1
+    proj_scale - scale in metres the shadow projection is computed at default=100
 
- # define map function
-def add_shadow_bands_to_img(image):
-    nir_drk_thresh = 0.15
+    returns
+    ee.Image dark_pixels, cloud_transform and shadows bands
+    """
     # Identify dark NIR pixels that are not water (potential cloud shadow pixels).
     SR_BAND_SCALE = 1e4
     dark_pixels = image.select('B8').lt(nir_drk_thresh*SR_BAND_SCALE).rename('dark_pixels')
@@ -116,39 +107,144 @@ def add_shadow_bands_to_img(image):
     shadow_azimuth = ee.Number(90).subtract(ee.Number(image.get('MEAN_SOLAR_AZIMUTH_ANGLE')))
 
     # Project shadows from clouds for the distance specified by the CLD_PRJ_DIST input.
-    cld_proj = (image.select('clouds').directionalDistanceTransform(shadow_azimuth, 1*10)
-        .reproject(**{'crs': image.select(0).projection(), 'scale': 100}) 
+    cld_proj = (is_cloud.directionalDistanceTransform(shadow_azimuth, cld_prj_dist*1000/proj_scale)
+        .reproject(**{'crs': image.select(0).projection(), 'scale': proj_scale}) 
         .select('distance') 
         .mask()
         .rename('cloud_transform'))
 
     # Identify the intersection of dark pixels with cloud shadow projection.
     shadows = cld_proj.multiply(dark_pixels).rename('shadows')
+    return ee.Image([dark_pixels, cld_proj, shadows])
 
-    # Add dark pixels, cloud projection, and identified shadows as image bands.
-    return image.addBands(ee.Image([dark_pixels, cld_proj, shadows]))
-
-def add_cld_shdw_mask_to_img(img):
-    # define buffer value to dilate edge of cloud objects in metres
-    buffer = 50
-
-    # Add cloud component bands.
-    img_cloud = add_cloud_bands_to_img(img)
+def cld_shdw_mask_band(image, is_cloud, shadows, buffer=50, scale=20):
+    """
+    function to return combined cloud and shadow mask band
 
-    # Add cloud shadow component bands.
-    img_cloud_shadow = add_shadow_bands_to_img(img_cloud)
+    args
+    image - Sentinel-2 ee.Image object, used for output projection
+    is_cloud - ee.Image cloud band, cloud = 1
+    shadows - ee.Image shadow band, shadow = 1
+    buffer - value in metres that cloud and shadow edges will be dilated by default=50
+    scale - scale in metres the mask is computed at default=20
 
+    returns
+    ee.Image cloudmask band, cloud and shadow = 1
+    """
     # Combine cloud and shadow mask, set cloud and shadow as value 1, else 0.
-    is_cld_shdw = img_cloud_shadow.select('clouds').add(img_cloud_shadow.select('shadows')).gt(0)
+    is_cld_shdw = is_cloud.add(shadows).gt(0)
 
     # Remove small cloud-shadow patches and dilate remaining pixels by BUFFER input.
     # 20 m scale is for speed, and assumes clouds don't require 10 m precision.
-    is_cld_shdw = (is_cld_shdw.focalMin(2).focalMax(buffer*2/20)
-        .reproject(**{'crs': img.select([0]).projection(), 'scale': 20})
+    return (is_cld_shdw.focalMin(2).focalMax(buffer*2/scale)
+        .reproject(**{'crs': image.select([0]).projection(), 'scale': scale})
         .rename('cloudmask'))
 
-    # Add the final cloud-shadow mask to the image.
-    return img_cloud_shadow.addBands(is_cld_shdw)
+def cloud_shadow_mask_pipeline(cloud_prob_threshold=60, nir_drk_thresh=0.15, cld_prj_dist=1, buffer=50, scale=20,
+                               proj_scale=100, output_bands=('cloudmask',), apply_mask=False, bands=None,
+                               band_names=None, cloud_prob_source='join'):
+    """
+    function to build a single .map() function that adds cloud and shadow mask to Sentinel-2 images,
+    masking, band selection and renaming are fused into the same function so only one map is added to the graph
+
+    args
+    cloud_prob_threshold - probability that pixel is cloudy if greater than threshold value default=60
+    nir_drk_thresh - NIR reflectance below which pixels are considered potential shadow default=0.15
+    cld_prj_dist - maximum distance in km shadows are projected from clouds default=1
+    buffer - value in metres that cloud and shadow edges will be dilated by default=50
+    scale - scale in metres the cloud and shadow mask is computed at default=20
+    proj_scale - scale in metres the shadow projection is computed at default=100
+    output_bands - list of bands from cloud_shadow_bands added to image default=('cloudmask',)
+    apply_mask - bool, mask cloud and shadow pixels default=False
+    bands - list of image bands to keep default=None and all bands are kept
+    band_names - list of new names for bands default=None
+    cloud_prob_source - 'join' if cloud probability image is joined as cloud_mask property with join_S2_cld_prob
+        or 'lookup' to find cloud probability image with get_cloud_probability_img. Default='join'
+
+    returns
+    function to be passed to ee.ImageCollection.map()
+    """
+    if cloud_prob_source not in {'join', 'lookup'}:
+        raise ValueError(cloud_prob_source + ' is not compatible, must be join or lookup.')
+    invalid_bands = set(output_bands) - set(cloud_shadow_bands)
+    if invalid_bands:
+        raise ValueError('{} are not valid output bands, must be in {}.'.format(sorted(invalid_bands), cloud_shadow_bands))
+
+    def apply(image):
+        if cloud_prob_source == 'join':
+            cld_prb = ee.Image(image.get('cloud_mask'))
+        else:
+            cld_prb = get_cloud_probability_img(image)
+
+        clouds = cloud_bands(cld_prb, cloud_prob_threshold)
+        shadows = shadow_bands(image, clouds.select('clouds'), nir_drk_thresh, cld_prj_dist, proj_scale)
+        cloudmask = cld_shdw_mask_band(image, clouds.select('clouds'), shadows.select('shadows'), buffer, scale)
+        components = ee.Image([clouds, shadows, cloudmask])
+
+        output = image
+        if apply_mask:
+            output = output.updateMask(cloudmask.Not())
+        if bands is not None:
+            output = output.select(bands, band_names) if band_names is not None else output.select(bands)
+        if output_bands:
+            output = output.addBands(components.select(list(output_bands)))
+        return output
+    return(apply)
+
+def add_cloud_bands_to_img(image):
+    """
+    function to add cloud probability and cloud bands to Sentinel-2 ee.Image, cloud probability image is found server-side
+
+    returns
+    ee.Image with probability and clouds bands
+    """
+    return image.addBands(cloud_bands(get_cloud_probability_img(image)))
+
+def add_cloud_bands_to_img_collection(image):
+    """
+    function to add cloud bands to images in ee.ImageCollection as a .map() function
+    args 
+    cloud_prob_treshold - probability that pixel is cloudy if greater than treshold value default=60
+
+    returns
+    ee.ImageCollection with cloud band
+    """
+    # get cloud prob from cloud_mask img
+    return image.addBands(cloud_bands(ee.Image(image.get('cloud_mask'))))
+
+
+def add_shadow_bands_to_img_collection(nir_drk_thresh=0.15):
+    """
+    function to add shadow bands to images in ee.ImageCollection as a .map() function
+    args 
+    nir_drk_thresh - NIR threshold which is considered cloud 
+
+    returns
+    ee.ImageCollection with shadow bands
+    """
+    # define map function
+    def add_shadow_bands(image):
+        return image.addBands(shadow_bands(image, image.select('clouds'), nir_drk_thresh))
+    return(add_shadow_bands)
+
+def add_shadow_bands_to_img(image):
+    """
+    function to add shadow bands to Sentinel-2 ee.Image with clouds band
+
+    returns
+    ee.Image with dark_pixels, cloud_transform and shadows bands
+    """
+    return image.addBands(shadow_bands(image, image.select('clouds')))
+
+def add_cld_shdw_mask_to_img(img):
+    """
+    function to add cloud and shadow bands and mask to single Sentinel-2 ee.Image, cloud probability image is found
+    server-side so function can be used inside .map()
+
+    returns
+    ee.Image with cloud, shadow and cloudmask bands
+    """
+    return cloud_shadow_mask_pipeline(output_bands=cloud_shadow_bands, cloud_prob_source='lookup')(img)
 
 def add_cld_shdw_mask_to_img_collection(buffer=50):
     """
@@ -159,30 +255,7 @@ def add_cld_shdw_mask_to_img_collection(buffer=50):
     returns
     sentinel ee.ImageCollection with cloud and shadow mask band
     """
-    
-    # define function to passed to ee.ImageCollection.map()
-    def add_cloud_shdw_band(img):
-        # Add cloud component bands.
-        img_cloud = add_cloud_bands_to_img_collection(img)
-
-        # Add cloud shadow component bands.
-        img_cloud_shadow = add_shadow_bands_to_img_collection(img_cloud)
-
-        def add_band(img):
-            # Combine cloud and shadow mask, set cloud and shadow as value 1, else 0.
-            is_cld_shdw = img_cloud_shadow.select('clouds').add(img_cloud_shadow.select('shadows')).gt(0)
-
-            # Remove small cloud-shadow patches and dilate remaining pixels by BUFFER input.
-            # 20 m scale is for speed, and assumes clouds don't require 10 m precision.
-            is_cld_shdw = (is_cld_shdw.focalMin(2).focalMax(buffer*2/20)
-                .reproject(**{'crs': img.select([0]).projection(), 'scale': 20})
-                .rename('cloudmask'))
-
-            # Add the final cloud-shadow mask to the image.
-            return img_cloud_shadow.addBands(is_cld_shdw)
-        return(add_band)
-    # return add cloud shdw band function
-    return(add_cloud_shdw_band)
+    return cloud_shadow_mask_pipeline(buffer=buffer, output_bands=cloud_shadow_bands)
 
 def mask_clouds(image):
     # select cloudmask band and invert so clouds/shdw = 0 and valid pixels = 1
@@ -217,24 +290,33 @@ def join_S2_cld_prob(img_collection, roi, start_date, end_date):
     ))
 
 def add_cloud_shadow_mask(img):
-    # add cloud bands
-    img_cloud = add_cloud_bands_to_img_collection(img)
-
-    # add cloud shadow bands
-    img_cloud_shadow = add_shadow_bands_to_img(img_cloud)
-
-    # Combine cloud and shadow mask, set cloud and shadow as value 1, else 0.
-    is_cld_shdw = img_cloud_shadow.select('clouds').add(img_cloud_shadow.select('shadows')).gt(0)
-
-    # Remove small cloud-shadow patches and dilate remaining pixels by BUFFER input.
-    # 20 m scale is for speed, and assumes clouds don't require 10 m precision.
-    is_cld_shdw = (is_cld_shdw.focalMin(2).focalMax(50*2/20)
-        .reproject(**{'crs': img.select([0]).projection(), 'scale': 20})
-        .rename('cloudmask'))
-
-    # Add the final cloud-shadow mask to the image.
-    return img_cloud_shadow.addBands(is_cld_shdw)
+    """
+    function to add cloud, shadow and cloudmask bands to Sentinel-2 ee.Image joined with join_S2_cld_prob
+    as a .map() function
 
+    returns
+    ee.Image with cloud, shadow and cloudmask bands
+    """
+    return cloud_shadow_mask_pipeline(output_bands=cloud_shadow_bands)(img)
 
+@ee_utils.requires_ee
+def mask_clouds_by_ids(image_ids, collection_id='COPERNICUS/S2_SR_HARMONIZED'):
+    """
+    function to add cloud and shadow mask and mask clouds for list of Sentinel-2 images,
+    all images are masked server-side so the collection can be fetched in one request. Images and their cloud
+    probability are loaded by id so catalogs aren't searched
 
+    args
+    image_ids - list of Sentinel-2 image ids or system:index values
+    collection_id - Sentinel-2 collection the images belong to default='COPERNICUS/S2_SR_HARMONIZED'
 
+    returns
+    ee.ImageCollection of cloud masked images with cloudmask band
+    """
+    # strip collection path from image ids
+    indexes = [i.split('/')[-1] for i in image_ids]
+    # set cloud probability image as cloud_mask property as join_S2_cld_prob does
+    img_collection = ee.ImageCollection([
+        ee.Image(collection_id + '/' + i).set('cloud_mask', ee.Image('COPERNICUS/S2_CLOUD_PROBABILITY/' + i))
+        for i in indexes])
+    return img_collection.map(cloud_shadow_mask_pipeline(apply_mask=True))
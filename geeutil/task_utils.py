@@ -0,0 +1,217 @@
+# import modules
+import ee
+import time
+import random
+from collections import deque
+import geeutil.rate_utils as rate_utils
+
+
+# define global variables
+# task states reported by earth engine
+active_states = {'UNSUBMITTED', 'READY', 'RUNNING', 'CANCEL_REQUESTED'}
+failed_states = {'FAILED', 'CANCELLED'}
+
+
+class EETaskBackend:
+    """
+    backend that starts ee.batch.Task objects and polls all task states with one task list request
+
+    any object with the same start and status methods can be passed to TaskManager, eg. a local fake task service
+    """
+
+    def start(self, task):
+        """
+        function to start task
+
+        Args
+        task - ee.batch.Task object
+
+        Returns
+        str, task id
+        """
+        rate_utils.call('task_start', task.start)
+        return task.id
+
+    def status(self, task_ids):
+        """
+        function to return status of tasks
+
+        Args
+        task_ids - list of task ids
+
+        Returns
+        dict, task id and status dict with state and error_message keys
+        """
+        task_ids = set(task_ids)
+        return {t['id']: t for t in rate_utils.call('task_status', ee.data.getTaskList) if t['id'] in task_ids}
+
+
+class TaskManager:
+    """
+    class to run many export tasks with up to max_concurrent tasks running at once
+
+    Args
+    backend - object with start(task) and status(task_ids) methods default=None and EETaskBackend is used
+    max_concurrent - maximum number of tasks running at once default=10
+    poll_interval - seconds between status requests default=30
+    max_retries - number of times failed tasks are restarted default=2
+    backoff - seconds to wait before first retry, doubled on each retry default=60
+    verbose - bool, print task state changes default=False
+    """
+
+    def __init__(self, backend=None, max_concurrent=10, poll_interval=30, max_retries=2, backoff=60, verbose=False):
+        self.backend = backend if backend is not None else EETaskBackend()
+        self.max_concurrent = max_concurrent
+        self.poll_interval = poll_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.verbose = verbose
+
+    def _log(self, entry, message):
+        if self.verbose:
+            print('{}: {}'.format(entry['name'], message))
+
+    def _start(self, entry, now):
+        # callables return a new task so failed tasks can be started again
+        task = entry['task']() if callable(entry['task']) else entry['task']
+        entry['attempts'] += 1
+        entry['submitted'] = now
+        entry['started'] = None
+        entry['id'] = self.backend.start(task)
+        self._log(entry, 'started {}'.format(entry['id']))
+
+    def _fail(self, entry, error, now, pending):
+        entry['error'] = error
+        # only tasks given as callables can be restarted
+        if entry['attempts'] <= self.max_retries and callable(entry['task']):
+            delay = self.backoff * 2 ** (entry['attempts'] - 1)
+            entry['ready_at'] = now + delay * random.uniform(0.5, 1.5)
+            pending.append(entry)
+            self._log(entry, 'failed, retrying: {}'.format(error))
+        else:
+            entry['state'] = 'FAILED'
+            self._log(entry, 'failed: {}'.format(error))
+
+    def _finish(self, entry, on_finish):
+        # entries waiting for a retry have no final state yet
+        if on_finish is not None and entry['state'] is not None:
+            on_finish(entry['name'], _result(entry))
+
+    def run(self, tasks, on_finish=None):
+        """
+        function to run tasks and wait until all tasks are finished
+
+        Args
+        tasks - list or dict of name and task, tasks are ee.batch.Task objects or functions returning a new
+            ee.batch.Task which allows failed tasks to be retried
+        on_finish - function called with task name and result dict as soon as each task completes or finally fails,
+            eg. to record progress that survives an interrupted run. Default=None
+
+        Returns
+        dict, with wall_time, number of completed, failed and retried tasks and per task state, attempts,
+            queue_time, run_time and error
+        """
+        if not isinstance(tasks, dict):
+            named = {}
+            for i, t in enumerate(tasks):
+                name = _task_name(t, i)
+                named[name if name not in named else '{}_{}'.format(name, i)] = t
+            tasks = named
+
+        t0 = time.time()
+        entries = [{'name': name, 'task': task, 'id': None, 'state': None, 'attempts': 0, 'ready_at': t0,
+                    'submitted': None, 'started': None, 'queue_time': 0, 'run_time': None, 'error': None}
+                   for name, task in tasks.items()]
+        pending = deque(entries)
+        running = {}
+
+        while pending or running:
+            now = time.time()
+            # start tasks up to concurrency cap
+            for _ in range(len(pending)):
+                if len(running) >= self.max_concurrent:
+                    break
+                entry = pending.popleft()
+                if entry['ready_at'] > now:
+                    pending.append(entry)
+                    continue
+                try:
+                    self._start(entry, now)
+                    running[entry['id']] = entry
+                except Exception as e:
+                    self._fail(entry, str(e), now, pending)
+                    self._finish(entry, on_finish)
+
+            if not running:
+                if pending:
+                    time.sleep(max(0, min(e['ready_at'] for e in pending) - time.time()))
+                continue
+
+            time.sleep(self.poll_interval)
+            now = time.time()
+            # get status of all running tasks in one request, tasks are polled again next interval if it fails
+            try:
+                statuses = self.backend.status(list(running))
+            except Exception as e:
+                if self.verbose:
+                    print('task status request failed, polling again: {}'.format(e))
+                continue
+            for task_id, entry in list(running.items()):
+                status = statuses.get(task_id, {})
+                state = status.get('state', 'READY')
+                if state == 'RUNNING' and entry['started'] is None:
+                    entry['started'] = now
+                    entry['queue_time'] += now - entry['submitted']
+                    self._log(entry, 'running')
+                if state in active_states:
+                    continue
+
+                del running[task_id]
+                started = entry['started'] if entry['started'] is not None else now
+                entry['run_time'] = now - started
+                if state in failed_states:
+                    self._fail(entry, status.get('error_message', state), now, pending)
+                else:
+                    entry['state'] = state
+                    entry['error'] = None
+                    self._log(entry, state.lower())
+                self._finish(entry, on_finish)
+
+        results = {e['name']: _result(e) for e in entries}
+        return {
+            'wall_time': time.time() - t0,
+            'completed': sum(e['state'] == 'COMPLETED' for e in entries),
+            'failed': sum(e['state'] == 'FAILED' for e in entries),
+            'retried': sum(max(0, e['attempts'] - 1) for e in entries),
+            'tasks': results}
+
+
+def _result(entry):
+    return {k: entry[k] for k in ('id', 'state', 'attempts', 'queue_time', 'run_time', 'error')}
+
+def _task_name(task, i):
+    # use export description as name if available
+    config = getattr(task, 'config', None) or {}
+    return config.get('description') or getattr(task, '__name__', None) or 'task_{}'.format(i)
+
+def run_tasks(tasks, max_concurrent=10, poll_interval=30, max_retries=2, backoff=60, backend=None, verbose=False,
+              on_finish=None):
+    """
+    function to run ee.batch export tasks with up to max_concurrent tasks running at once
+
+    Args
+    tasks - list or dict of name and task, tasks are ee.batch.Task objects or functions returning a new
+        ee.batch.Task which allows failed tasks to be retried
+    max_concurrent - maximum number of tasks running at once default=10
+    poll_interval - seconds between status requests default=30
+    max_retries - number of times failed tasks are restarted default=2
+    backoff - seconds to wait before first retry, doubled on each retry default=60
+    backend - object with start(task) and status(task_ids) methods default=None and EETaskBackend is used
+    verbose - bool, print task state changes default=False
+    on_finish - function called with task name and result dict as each task finishes default=None
+
+    Returns
+    dict, summary of run times, queue times and failures returned by TaskManager.run
+    """
+    manager = TaskManager(backend, max_concurrent, poll_interval, max_retries, backoff, verbose)
+    return manager.run(tasks, on_finish)
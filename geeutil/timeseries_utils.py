@@ -0,0 +1,176 @@
+# import modules
+import ee
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import geeutil.ee_utils as ee_utils
+import geeutil.feature_utils as feature_utils
+import geeutil.rate_utils as rate_utils
+
+
+# define global variables
+# default maximum number of points per request
+max_request_points = 1000
+# default maximum number of point and image rows per request, keeps responses under earth engine payload limits
+max_request_rows = 20000
+
+
+def image_times(collection):
+    """
+    function to return sorted unique acquisition times of images in collection in one request
+
+    Args
+    collection - ee.ImageCollection object
+
+    Returns
+    list of tuples, time in milliseconds and number of images acquired at that time
+    """
+    times = rate_utils.call('info', collection.aggregate_array('system:time_start').getInfo)
+    counts = {}
+    for t in times:
+        counts[t] = counts.get(t, 0) + 1
+    return sorted(counts.items())
+
+def split_dates(times, max_images):
+    """
+    function to split acquisition times into consecutive date ranges with at most max_images images,
+    images acquired at the same time are never split across ranges
+
+    Args
+    times - list of tuples returned by image_times
+    max_images - maximum number of images per range
+
+    Returns
+    list of tuples, start and end time in milliseconds, end is exclusive
+    """
+    ranges = []
+    start, count, last = None, 0, None
+    for t, n in times:
+        if start is not None and count + n > max_images:
+            ranges.append((start, last + 1))
+            start, count = None, 0
+        if start is None:
+            start = t
+        count += n
+        last = t
+    if start is not None:
+        ranges.append((start, last + 1))
+    return ranges
+
+def sample_points(collection, points, bands, scale, id_column):
+    """
+    function to sample bands of every image in collection at points, rows where any band is masked are dropped
+
+    Args
+    collection - ee.ImageCollection object
+    points - ee.FeatureCollection of points with id_column property
+    bands - list of band names
+    scale - sampling resolution in metres
+    id_column - name of point id property
+
+    Returns
+    ee.List of rows, [id, image id, time, band values]
+    """
+    reducer = ee.Reducer.first().forEach(bands)
+
+    def sample(image):
+        props = {'image_id': image.get('system:index'), 'time': image.get('system:time_start')}
+        return image.select(bands).reduceRegions(points, reducer, scale).map(lambda f: f.set(props))
+
+    columns = [id_column, 'image_id', 'time'] + list(bands)
+    samples = collection.map(sample).flatten().filter(ee.Filter.notNull(bands))
+    return samples.reduceColumns(ee.Reducer.toList(len(columns)), columns).get('list')
+
+@ee_utils.requires_ee
+def extract_timeseries(gdf, collection, bands, scale, id_column=None, max_points=max_request_points,
+                       max_rows=max_request_rows, max_workers=8, folder=None, verbose=False):
+    """
+    function to extract time series of bands at points from every image in collection, points and dates are split
+    into chunks under request limits and chunks are sampled in parallel
+
+    Args
+    gdf - geopandas dataframe of Point features
+    collection - ee.ImageCollection object eg. returned by imagecollection_utils.gen_imageCollection
+    bands - list of band names
+    scale - sampling resolution in metres
+    id_column - column identifying points default=None and gdf index is used
+    max_points - maximum number of points per request default=max_request_points
+    max_rows - maximum number of point and image rows per request default=max_request_rows
+    max_workers - number of requests run at the same time default=8
+    folder - folder chunks are written to as parquet files default=None and a dataframe is returned. Files are named by
+        the date range and a hash of the point ids of the chunk, chunks that are already written are skipped so
+        extraction can be resumed. Only the returned filepaths belong to this extraction
+    verbose - bool, print progress default=False
+
+    Returns
+    tuple, dataframe with id, image_id, date and band columns or list of parquet filepaths if folder is set,
+        and dict with rows, requests, seconds and rows_per_s
+    """
+    import pandas as pd
+
+    t0 = time.perf_counter()
+    if id_column is None:
+        id_column = gdf.index.name or 'id'
+        gdf = gdf.reset_index().rename(columns={gdf.index.name or 'index': id_column})
+    bands = list(bands)
+
+    # split points and dates so each request returns at most max_rows rows, points are sorted by id so chunks
+    # don't depend on the order of gdf
+    gdf = gdf.sort_values(id_column, kind='stable')
+    max_points = max(1, min(max_points, max_rows))
+    point_chunks = [gdf.iloc[i:i + max_points] for i in range(0, len(gdf), max_points)]
+    date_ranges = split_dates(image_times(collection), max(1, max_rows // max_points))
+
+    columns = [id_column, 'image_id', 'time'] + bands
+    if folder is not None:
+        os.makedirs(folder, exist_ok=True)
+    lock = threading.Lock()
+    stats = {'rows': 0, 'requests': 1}
+
+    def part_path(i, j):
+        # name by chunk content so parts of a previous run with other dates or points are never reused
+        start, end = date_ranges[j]
+        ids = hashlib.sha1(repr(point_chunks[i][id_column].tolist()).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(folder, 'part-{}-{}-{}.parquet'.format(start, end, ids))
+
+    def extract(i, j):
+        path = part_path(i, j) if folder is not None else None
+        if path is not None and os.path.exists(path):
+            return path
+        points = ee.FeatureCollection([f for f, _ in feature_utils.gdf_to_features(point_chunks[i], [id_column])])
+        start, end = date_ranges[j]
+        rows = rate_utils.call('info', sample_points(collection.filterDate(start, end), points, bands, scale,
+                                                     id_column).getInfo)
+        df = pd.DataFrame(rows, columns=columns)
+        df.insert(2, 'date', pd.to_datetime(df.pop('time'), unit='ms'))
+        with lock:
+            stats['rows'] += len(df)
+            stats['requests'] += 1
+        if path is None:
+            return df
+        df.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+        return path
+
+    chunks = [(i, j) for i in range(len(point_chunks)) for j in range(len(date_ranges))]
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(extract, i, j): (i, j) for i, j in chunks}
+        for n, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if verbose:
+                print('{}/{} chunks extracted, {} rows'.format(n, len(chunks), stats['rows']))
+
+    ordered = [results[c] for c in chunks]
+    if folder is not None:
+        result = ordered
+    elif ordered:
+        result = pd.concat(ordered, ignore_index=True)
+    else:
+        result = pd.DataFrame(columns=[id_column, 'image_id', 'date'] + bands)
+
+    seconds = time.perf_counter() - t0
+    stats.update({'chunks': len(chunks), 'seconds': seconds, 'rows_per_s': stats['rows'] / seconds if seconds else 0})
+    return result, stats
@@ -0,0 +1,148 @@
+# import modules
+import os
+import hashlib
+import numpy as np
+import geeutil.ee_utils as ee_utils
+import geeutil.image_utils as image_utils
+
+
+# define global variables
+# default chunk side in pixels, chunks are reduced further if they are over the request size limit
+default_chunk_size = 512
+
+
+def image_hash(ee_image):
+    """
+    function to return hash of serialized ee.Image expression, no request is made
+    
+    Args
+    ee_image - ee.Image object
+
+    Returns
+    str, sha1 hash of image
+    """
+    return hashlib.sha1(ee_image.serialize().encode('utf-8')).hexdigest()
+
+def chunk_key(img_hash, tile, bands, crs):
+    """
+    function to return key of chunk, chunks are keyed by image, bands, crs and pixel window so chunks of the same
+    image at another scale, region or chunk size get different keys
+
+    Args
+    img_hash - hash returned by image_hash
+    tile - dict, tile returned by image_utils.split_pixel_grid
+    bands - list of band names
+    crs - output crs
+
+    Returns
+    str, sha1 hash of chunk
+    """
+    text = repr([img_hash, list(bands), crs, tile['crs_transform'], tile['width'], tile['height']])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def chunk_path(cache_dir, img_hash, tile, bands, crs):
+    """
+    function to return path of cached chunk named by chunk_key
+    
+    Args
+    cache_dir - folder of chunk cache
+    img_hash - hash returned by image_hash
+    tile - dict, tile returned by image_utils.split_pixel_grid
+    bands - list of band names
+    crs - output crs
+
+    Returns
+    str, filepath of chunk .npy file
+    """
+    return os.path.join(cache_dir, chunk_key(img_hash, tile, bands, crs) + '.npy')
+
+@ee_utils.requires_ee
+def fetch_chunk(ee_image, tile, bands, crs, cache_dir=None, img_hash=None):
+    """
+    function to fetch chunk of ee.Image as numpy structured array, reading from and writing to chunk cache
+    if cache_dir is set
+    
+    Args
+    ee_image - ee.Image object
+    tile - dict, tile returned by image_utils.split_pixel_grid
+    bands - list of band names
+    crs - output crs
+    cache_dir - folder of chunk cache default=None and chunks are not cached
+    img_hash - hash returned by image_hash default=None and hash is computed from ee_image
+
+    Returns
+    numpy structured array with one field per band
+    """
+    if cache_dir is None:
+        return image_utils.fetch_pixels(ee_image, tile, bands, crs)
+
+    path = chunk_path(cache_dir, img_hash or image_hash(ee_image), tile, bands, crs)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r')
+    array = image_utils.fetch_pixels(ee_image, tile, bands, crs)
+    # write to temporary file first so concurrent readers never see partial chunks
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+    return array
+
+def chunk_band(array, band, dtype):
+    """
+    function to return band of fetched chunk as array of dtype
+    """
+    return array[band].astype(dtype, copy=False)
+
+@ee_utils.requires_ee
+def open_image(ee_image, region, crs, scale, chunk_size=default_chunk_size, cache_dir=None,
+               max_tile_bytes=image_utils.max_request_bytes):
+    """
+    function to open ee.Image as lazy xarray Dataset backed by dask arrays, pixels are only fetched with
+    ee.data.computePixels when chunks are computed. Chunks are fetched in parallel by the dask scheduler and
+    each chunk is fetched once for all bands. Dask workers initialize earth engine on first fetch
+    
+    Args
+    ee_image - ee.Image object
+    region - extent of image
+    crs - output crs
+    scale - output_resolution
+    chunk_size - chunk side in pixels default=default_chunk_size
+    cache_dir - folder fetched chunks are cached in as .npy files default=None and chunks are not cached
+    max_tile_bytes - maximum uncompressed bytes per chunk default=image_utils.max_request_bytes
+
+    Returns
+    xarray.Dataset with one (y, x) variable per band, crs and transform are set in attrs
+    """
+    import dask
+    import dask.array as da
+    import xarray as xr
+
+    estimate = image_utils.estimate_size(ee_image, region, crs, scale)
+    bands, grid = estimate['bands'], estimate['grid']
+    tiles = image_utils.split_pixel_grid(grid, estimate['bytes_per_pixel'], max_tile_bytes, chunk_size)
+
+    img_hash = image_hash(ee_image)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # one delayed fetch per chunk shared by all bands
+    n_rows = tiles[-1]['row'] + 1
+    n_cols = tiles[-1]['col'] + 1
+    chunks = [[None] * n_cols for _ in range(n_rows)]
+    for tile in tiles:
+        key = 'ee-chunk-' + chunk_key(img_hash, tile, bands, crs)
+        chunks[tile['row']][tile['col']] = (
+            dask.delayed(fetch_chunk)(ee_image, tile, bands, crs, cache_dir, img_hash, dask_key_name=key), tile)
+
+    data_vars = {}
+    for band in bands:
+        dtype = np.dtype(image_utils.pixel_type_dtype(estimate['types'][band]))
+        blocks = [[da.from_delayed(dask.delayed(chunk_band)(chunk, band, dtype), (tile['height'], tile['width']), dtype)
+                   for chunk, tile in row] for row in chunks]
+        data_vars[band] = (('y', 'x'), da.block(blocks))
+
+    # pixel centre coordinates
+    x = grid['x_min'] + (np.arange(grid['width']) + 0.5) * scale
+    y = grid['y_max'] - (np.arange(grid['height']) + 0.5) * scale
+    return xr.Dataset(data_vars, coords={'y': y, 'x': x},
+                      attrs={'crs': crs, 'transform': [scale, 0, grid['x_min'], 0, -scale, grid['y_max']]})
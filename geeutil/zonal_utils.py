@@ -0,0 +1,182 @@
+# import modules
+import ee
+import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import geeutil.ee_utils as ee_utils
+import geeutil.feature_utils as feature_utils
+import geeutil.rate_utils as rate_utils
+
+
+# define global variables
+# default maximum number of features per reduceRegions request
+max_batch_features = 2000
+# approximate number of pixels one tile can reduce before tileScale is increased
+max_tile_pixels = 2 ** 24
+# fragments of server errors caused by batches that are too large, these batches are split and retried
+oversized_errors = ('memory limit', 'timed out', 'too large', 'payload size', 'too many pixels')
+
+
+def batch_features(gdf, max_features=max_batch_features, batch_column=None):
+    """
+    function to split features into spatially coherent batches. Features are grouped by batch_column, eg. the
+    parent_id of h3 cells, and groups are packed into batches, otherwise features are ordered along a hilbert curve
+
+    Args
+    gdf - geopandas dataframe
+    max_features - maximum number of features per batch default=max_batch_features
+    batch_column - column features are grouped by default=None and parent_id is used if gdf has h3 parents
+
+    Returns
+    list of geopandas dataframes
+    """
+    import pandas as pd
+
+    if batch_column is None and 'parent_id' in gdf.columns:
+        batch_column = 'parent_id'
+    if batch_column is not None:
+        groups = [g for _, g in gdf.groupby(batch_column, sort=True, dropna=False)]
+    else:
+        order = gdf.hilbert_distance().argsort(kind='stable')
+        groups = [gdf.iloc[order.values]]
+
+    # pack consecutive groups into batches and split groups larger than max_features
+    batches, current, size = [], [], 0
+    for group in groups:
+        for i in range(0, len(group), max_features):
+            part = group.iloc[i:i + max_features]
+            if size + len(part) > max_features and current:
+                batches.append(current)
+                current, size = [], 0
+            current.append(part)
+            size += len(part)
+    if current:
+        batches.append(current)
+    return [b[0] if len(b) == 1 else pd.concat(b) for b in batches]
+
+def estimate_tile_scale(gdf, scale, n_bands):
+    """
+    function to estimate tileScale needed to reduce features from their area, scale and number of bands
+
+    Args
+    gdf - geopandas dataframe
+    scale - reduction resolution in metres
+    n_bands - number of bands reduced
+
+    Returns
+    int, tileScale between 1 and 16
+    """
+    area = gdf.geometry.to_crs(gdf.estimate_utm_crs()).area.sum()
+    pixels = area / scale ** 2 * n_bands
+    if pixels <= max_tile_pixels:
+        return 1
+    return int(min(16, 2 ** math.ceil(math.log2(pixels / max_tile_pixels))))
+
+def is_oversized(error):
+    """
+    function to return True if earth engine error was caused by request that is too large to compute
+    """
+    message = str(error).lower()
+    return any(fragment in message for fragment in oversized_errors)
+
+def reduce_batch(image, gdf, reducer, scale, id_column, tile_scale):
+    """
+    function to reduce image over features of batch in one request
+
+    Args
+    image - ee.Image object
+    gdf - geopandas dataframe of batch
+    reducer - ee.Reducer object
+    scale - reduction resolution in metres
+    id_column - column identifying features
+    tile_scale - tileScale passed to reduceRegions
+
+    Returns
+    list of dicts, id and statistics of each feature
+    """
+    # lines are reduced along their pixels, not over a buffer
+    features = ee.FeatureCollection([f for f, _ in feature_utils.gdf_to_features(gdf, [id_column], line_buffer=None)])
+    reduced = image.reduceRegions(features, reducer, scale, tileScale=tile_scale)
+    # drop geometries so only statistics are returned
+    reduced = reduced.map(lambda f: ee.Feature(None).copyProperties(f))
+    return [f['properties'] for f in rate_utils.call('info', reduced.getInfo)['features']]
+
+@ee_utils.requires_ee
+def zonal_stats(gdf, image, reducers='mean', scale=30, id_column=None, max_features=max_batch_features,
+                batch_column=None, tile_scale=None, max_splits=3, max_workers=8, verbose=False):
+    """
+    function to calculate statistics of image over features of geodataframe in spatially coherent batches run in
+    parallel. Batches that fail because they are too large are split in half and retried with doubled tileScale
+
+    Args
+    gdf - geopandas dataframe eg. h3 geodataframe
+    image - ee.Image or ee.ImageCollection object, collections are reduced per image with toBands
+    reducers - ee.Reducer, reducer name or list of names and ee.Reducer objects default='mean'
+    scale - reduction resolution in metres default=30
+    id_column - column identifying features default=None and 'index' is used for h3 geodataframes, otherwise gdf index
+    max_features - maximum number of features per request default=max_batch_features
+    batch_column - column features are grouped into batches by default=None and h3 parent_id is used if available
+    tile_scale - tileScale passed to reduceRegions default=None and tileScale is estimated for each batch
+    max_splits - number of times a batch is split before error is raised default=3
+    max_workers - number of requests run at the same time default=8
+    verbose - bool, print progress default=False
+
+    Returns
+    tuple, dataframe of statistics indexed by id_column and dict with features, batches, requests, splits, seconds and
+        dropped, the ids of features with empty geometry that aren't reduced
+    """
+    import pandas as pd
+
+    t0 = time.perf_counter()
+    if isinstance(image, ee.ImageCollection):
+        image = image.toBands()
+    if id_column is None:
+        if 'index' in gdf.columns:
+            id_column = 'index'
+        else:
+            id_column = gdf.index.name or 'id'
+            gdf = gdf.reset_index().rename(columns={gdf.index.name or 'index': id_column})
+    # features with empty geometry can't be reduced
+    empty = gdf.geometry.isna() | gdf.geometry.is_empty
+    dropped = gdf.loc[empty, id_column].tolist()
+    gdf = gdf[~empty]
+    reducer = ee_utils.combine_reducers(reducers)
+    n_bands = rate_utils.call('info', image.bandNames().size().getInfo)
+    batches = batch_features(gdf, max_features, batch_column)
+
+    lock = threading.Lock()
+    stats = {'features': len(gdf), 'batches': len(batches), 'requests': 1, 'splits': 0, 'dropped': dropped}
+
+    def run(batch, splits=0, scale_hint=None):
+        ts = scale_hint or tile_scale or estimate_tile_scale(batch, scale, n_bands)
+        try:
+            rows = reduce_batch(image, batch, reducer, scale, id_column, ts)
+            with lock:
+                stats['requests'] += 1
+            return rows
+        except ee.EEException as error:
+            with lock:
+                stats['requests'] += 1
+            if not is_oversized(error) or splits >= max_splits or (len(batch) == 1 and ts >= 16):
+                raise
+            with lock:
+                stats['splits'] += 1
+            half = max(1, len(batch) // 2)
+            rows = []
+            for part in (batch.iloc[:half], batch.iloc[half:]):
+                if len(part):
+                    rows.extend(run(part, splits + 1, min(16, ts * 2)))
+            return rows
+
+    frames = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run, batch) for batch in batches]
+        for n, future in enumerate(as_completed(futures), 1):
+            frames.append(pd.DataFrame.from_records(future.result()))
+            if verbose:
+                print('{}/{} batches reduced'.format(n, len(batches)))
+
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=[id_column])
+    stats['seconds'] = time.perf_counter() - t0
+    return df.set_index(id_column), stats
@@ -0,0 +1,18 @@
+import pytest
+
+
+@pytest.fixture(scope='session')
+def ee_session():
+    """
+    fixture that initializes earth engine, tests that need the earth engine api are skipped when it isn't installed
+    or credentials aren't available
+    """
+    ee = pytest.importorskip('ee')
+    pytest.importorskip('requests')
+    import geeutil.ee_utils as ee_utils
+
+    try:
+        ee_utils.initialize()
+    except Exception as e:
+        pytest.skip('earth engine could not be initialized: {}'.format(e))
+    return ee
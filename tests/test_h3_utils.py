@@ -0,0 +1,26 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import geeutil.h3_utils as h3_utils
+
+
+def test_read_compact_does_not_copy(tmp_path):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+
+    n = 1_000_000
+    df = pd.DataFrame({'index': np.arange(n, dtype=np.uint64), 'parent_id': np.arange(n, dtype=np.uint64) // 7,
+                       'resolution': np.full(n, 9, dtype=np.uint8)})
+    path = str(tmp_path / 'grid.arrow')
+    h3_utils.write_compact(df, path)
+
+    tracemalloc.start()
+    result = h3_utils.read_compact(path)
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # columns are 17 MB, only arrow and pandas bookkeeping is allocated
+    assert allocated < 1024 ** 2
+    pd.testing.assert_frame_equal(result, df)
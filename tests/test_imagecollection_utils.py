@@ -0,0 +1,25 @@
+import pytest
+
+
+def test_clear_fraction_partial_scene(ee_session):
+    ee = ee_session
+    import geeutil.imagecollection_utils as ic_utils
+
+    # clear scene that only covers the western half of the roi
+    roi = ee.Geometry.Rectangle([172.0, -43.6, 172.1, -43.5], 'EPSG:4326', False)
+    half = ee.Geometry.Rectangle([172.0, -43.6, 172.05, -43.5], 'EPSG:4326', False)
+    scene = ee.Image.constant(1).clip(half)
+
+    fraction = ee.Image(ic_utils.clear_fraction(roi, 100)(scene)).get('clear_fraction').getInfo()
+    assert fraction == pytest.approx(0.5, abs=0.05)
+
+
+def test_clear_fraction_masked_scene(ee_session):
+    ee = ee_session
+    import geeutil.imagecollection_utils as ic_utils
+
+    roi = ee.Geometry.Rectangle([172.0, -43.6, 172.1, -43.5], 'EPSG:4326', False)
+    scene = ee.Image.constant(1).updateMask(0)
+
+    fraction = ee.Image(ic_utils.clear_fraction(roi, 100)(scene)).get('clear_fraction').getInfo()
+    assert fraction == pytest.approx(0)
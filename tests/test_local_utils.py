@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import geeutil.local_utils as local_utils
+
+
+def test_normalised_difference_masks_negative_inputs():
+    # ee.Image.normalizedDifference masks pixels where either input is negative
+    green = np.array([0.1, -0.05, 0.3, 0.2], dtype=np.float32)
+    nir = np.array([0.3, 0.2, -0.1, 0.2], dtype=np.float32)
+    expected = np.array([-0.5, np.nan, np.nan, 0.0], dtype=np.float32)
+
+    result = local_utils.normalised_difference(green, nir)
+    np.testing.assert_allclose(result, expected, rtol=1e-6)
+    assert result.dtype == np.float32
+
+
+def test_normalised_difference_zero_sum():
+    assert np.isnan(local_utils.normalised_difference(np.zeros(1), np.zeros(1))[0])
+
+
+def test_normalised_difference_range():
+    rng = np.random.default_rng(0)
+    a = rng.uniform(-0.2, 1, (64, 64))
+    b = rng.uniform(-0.2, 1, (64, 64))
+    result = local_utils.normalised_difference(a, b)
+    valid = result[~np.isnan(result)]
+    assert valid.min() >= -1 and valid.max() <= 1
+    assert np.isnan(result[(a < 0) | (b < 0)]).all()
+
+
+def test_compute_index_ndvi():
+    bands = {'NIR': np.array([[0.4, 0.5]]), 'red': np.array([[0.1, -0.02]])}
+    np.testing.assert_allclose(local_utils.compute_index(bands, 'ndvi'), [[0.6, np.nan]], rtol=1e-6)
+
+
+@pytest.mark.parametrize('name', ['ndvi', 'ndwi', 'mndwi', 'ndmi'])
+def test_compute_index_matches_ee(ee_session, name):
+    ee = ee_session
+    import geeutil.normalised_difference as nd
+
+    # green is negative so ndwi and mndwi are masked by earth engine
+    values = {'blue': 0.05, 'green': -0.04, 'red': 0.1, 'NIR': 0.3, 'SWIR1': 0.2, 'SWIR2': 0.15}
+    image = ee.Image.constant(list(values.values())).rename(list(values))
+    point = ee.Geometry.Point([172.0, -43.5])
+    remote = nd.index_bands(image, [name]).reduceRegion(ee.Reducer.first(), point, 30).get(name).getInfo()
+
+    local = local_utils.compute_index({k: np.array([v]) for k, v in values.items()}, name)[0]
+    if remote is None:
+        assert np.isnan(local)
+    else:
+        assert local == pytest.approx(remote, abs=1e-6)
@@ -0,0 +1,27 @@
+import geeutil.task_utils as task_utils
+
+
+class FlakyBackend:
+    # fake task service whose first status request fails
+    def __init__(self):
+        self.polls = 0
+
+    def start(self, task):
+        return task
+
+    def status(self, task_ids):
+        self.polls += 1
+        if self.polls == 1:
+            raise IOError('503 Service Unavailable')
+        return {t: {'state': 'COMPLETED'} for t in task_ids}
+
+
+def test_run_polls_again_after_status_error():
+    backend = FlakyBackend()
+    finished = []
+    manager = task_utils.TaskManager(backend=backend, poll_interval=0)
+    result = manager.run({'a': 'a', 'b': 'b'}, on_finish=lambda name, r: finished.append((name, r['state'])))
+
+    assert backend.polls == 2
+    assert result['completed'] == 2
+    assert sorted(finished) == [('a', 'COMPLETED'), ('b', 'COMPLETED')]
@@ -0,0 +1,13 @@
+import geeutil.image_utils as image_utils
+import geeutil.xarray_utils as xarray_utils
+
+
+def test_chunk_keys_differ_by_scale():
+    bounds = [[1500000, 5100000], [1510240, 5100000], [1510240, 5110240], [1500000, 5110240]]
+    keys = []
+    for scale in (10, 20):
+        grid = image_utils.get_pixel_grid(bounds, scale)
+        tile = image_utils.split_pixel_grid(grid, 4, max_tile_dim=512)[0]
+        keys.append(xarray_utils.chunk_key('img', tile, ['B4'], 'EPSG:2193'))
+    # first chunk has the same row and column at both scales
+    assert keys[0] != keys[1]